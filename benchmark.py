@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from main import add_runtime_arguments, bootstrap, runtime_options, shutdown
+from service_bus import ServiceBus
+from stock import get_stock
+from storage import get_store
+from utils import load_json, save_json
+
+
+class NoopService:
+    """Сервис-заглушка для измерения накладных расходов шины."""
+
+    def __init__(self):
+        self.bus = None
+
+    def handle(self, data):
+        pass
+
+
+def measure(fn, iterations):
+    """Выполняет fn iterations раз, возвращает статистику времени в микросекундах."""
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "n": iterations,
+        "mean_us": sum(timings) / iterations,
+        "p50_us": timings[iterations // 2],
+        "p99_us": timings[min(iterations - 1, iterations * 99 // 100)],
+        "min_us": timings[0]
+    }
+
+
+def start_app(data_dir, options, **overrides):
+    """Запускает систему (bootstrap) с данными и журналом во временном каталоге."""
+    options = dict(options, quiet=True, **overrides)
+    return bootstrap(**options, data_dir=data_dir, log_path=os.path.join(data_dir, "logs.txt"),
+                     events_dir=os.path.join(data_dir, "logs"))
+
+
+def add_bench_item(quantity):
+    """Добавляет товар для замеров (и в движок остатков, если он включен)."""
+    get_store().put("inventory", "Мышь", {"quantity": quantity, "price": 500.0,
+                                          "reserved": {}, "reserved_total": 0})
+    get_store().flush()
+    if get_stock() is not None:
+        get_stock().put("Мышь", quantity, 500.0)
+
+
+def bench_bus(iterations):
+    results = []
+    for subscribers in (1, 4, 16):
+        bus = ServiceBus()
+        for i in range(subscribers):
+            bus.register_service(f"noop{i}", NoopService())
+            bus.subscribe("bench_event", f"noop{i}")
+        payload = {"order_id": "bench", "username": "bench"}
+        results.append(dict(name="bus_publish", params={"subscribers": subscribers},
+                            **measure(lambda i: bus.publish("bench_event", payload), iterations)))
+    results.append(dict(name="bus_send", params={},
+                        **measure(lambda i: bus.send("noop0", payload), iterations)))
+    return results
+
+
+def bench_json(iterations, data_dir):
+    results = []
+    for records in (100, 1000, 10000):
+        path = os.path.join(data_dir, f"orders_{records}.json")
+        orders = {
+            f"{i:08x}": {
+                "username": f"user{i % 100}",
+                "items": [{"item_name": "Мышь", "quantity": 1}],
+                "status": "in_delivery",
+                "total": 500.0
+            }
+            for i in range(records)
+        }
+        results.append(dict(name="save_json", params={"records": records, "bytes": None},
+                            **measure(lambda i: save_json(path, orders), iterations)))
+        results[-1]["params"]["bytes"] = os.path.getsize(path)
+        results.append(dict(name="load_json", params={"records": records, "bytes": os.path.getsize(path)},
+                            **measure(lambda i: load_json(path), iterations)))
+    return results
+
+
+def bench_user_chain(iterations, data_dir, options):
+    app = start_app(data_dir, options)
+    bus = app["bus"]
+    register = lambda i: bus.request("auth", {
+        "action": "register",
+        "username": f"bench_user_{i}",
+        "password": "bench",
+        "role": "user",
+        "email": f"bench_user_{i}@example.com"
+    })
+    result = measure(register, iterations)
+    shutdown(app)
+    return [dict(name="user_chain", params={"storage": options["storage"]}, **result)]
+
+
+def bench_order_chain(iterations, data_dir, options):
+    app = start_app(data_dir, options)
+    add_bench_item(iterations * 10)
+    bus = app["bus"]
+    order = lambda i: bus.request("order", {
+        "action": "create_order",
+        "username": f"user{i % 10}",
+        "items": [{"item_name": "Мышь", "quantity": 1}]
+    })
+    result = measure(order, iterations)
+    shutdown(app)
+    return [dict(name="order_chain", params={"storage": options["storage"]}, **result)]
+
+
+def bench_reserve(iterations, data_dir, options):
+    """Резерв одного товара: остатки в хранилище и в движке остатков (stock.bin)."""
+    results = []
+    for engine in ("store", "stock"):
+        app = start_app(os.path.join(data_dir, engine), options, stock=engine == "stock")
+        add_bench_item(iterations * 10)
+        bus = app["bus"]
+        reserve = lambda i: bus.request("inventory", {
+            "action": "reserve_item",
+            "item_name": "Мышь",
+            "quantity": 1,
+            "order_id": f"order{i}"
+        })
+        results.append(dict(name="reserve_item", params={"storage": options["storage"], "engine": engine},
+                            **measure(reserve, iterations)))
+        shutdown(app)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки шины, JSON хранилища и цепочек событий")
+    parser.add_argument("--iterations", type=int, default=200, help="число повторов каждого замера")
+    parser.add_argument("--output", default="bench_results.json", help="файл с результатами (JSON)")
+    # Параметры запуска системы для цепочек событий (--storage, --workers, ...)
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+    options = runtime_options(args)
+
+    results = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Сервисы печатают сообщения - скрываем их, чтобы не искажать замеры
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results += bench_bus(args.iterations * 10)
+            results += bench_json(max(1, args.iterations // 10), data_dir)
+            results += bench_user_chain(args.iterations, os.path.join(data_dir, "users"), options)
+            results += bench_order_chain(args.iterations, os.path.join(data_dir, "orders"), options)
+            results += bench_reserve(args.iterations, os.path.join(data_dir, "reserve"), options)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "iterations": args.iterations,
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+    for result in results:
+        params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['name']:<12} {params:<35} mean {result['mean_us']:>10.1f} мкс  p50 {result['p50_us']:>10.1f} мкс")
+    print(f"\nРезультаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+HTTP/JSON интерфейс к сервисам через шину (стандартная библиотека).
+Каждое соединение обслуживается своим потоком, соединения keep-alive (HTTP/1.1).
+Авторизация - заголовок "Authorization: Bearer <token>" с токеном из /login.
+
+    POST   /register            {"username", "password", "email"}
+    POST   /login               {"username", "password"} -> сессия с токеном
+    POST   /logout
+    GET    /inventory
+    POST   /inventory           {"item_name", "quantity", "price"}   (admin)
+    PUT    /inventory/<товар>   {"quantity", "price"}                (admin)
+    DELETE /inventory/<товар>                                        (admin)
+    GET    /orders[?status=...]                   (status - только admin)
+    POST   /orders              {"items": [{"item_name", "quantity"}]}  (заголовок Idempotency-Key)
+    DELETE /orders/<order_id>   отмена заказа
+
+Пример:
+    python http_api.py --port 8080 --quiet --workers 4
+"""
+
+import argparse
+import json
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from main import add_runtime_arguments, bootstrap, load_inventory, runtime_options, shutdown
+from services.user_services import get_sessions
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Обработчик запросов: маршрут (метод, первый сегмент пути) -> метод обработчика.
+    Обработчик получает оставшиеся сегменты пути, тело и параметры запроса
+    и возвращает (код ответа, данные JSON).
+    """
+
+    protocol_version = "HTTP/1.1"
+    server_version = "LB4"
+
+    ROUTES = {
+        ("POST", "register"): "_register",
+        ("POST", "login"): "_login",
+        ("POST", "logout"): "_logout",
+        ("GET", "inventory"): "_view_inventory",
+        ("POST", "inventory"): "_add_item",
+        ("PUT", "inventory"): "_update_item",
+        ("DELETE", "inventory"): "_remove_item",
+        ("GET", "orders"): "_list_orders",
+        ("POST", "orders"): "_create_order",
+        ("DELETE", "orders"): "_cancel_order"
+    }
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        """Читает тело запроса (JSON объект). None - некорректное тело."""
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # Граница тела неизвестна: соединение закрывается после ответа
+            self.close_connection = True
+            return None
+        if not length:
+            return {}
+        raw = self.rfile.read(length)
+        try:
+            body = json.loads(raw)
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return body if isinstance(body, dict) else None
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        # Тело читается до выбора маршрута: непрочитанный остаток
+        # был бы принят за следующий запрос того же соединения
+        body = self._read_body()
+        handler = self.ROUTES.get((method, parts[0] if parts else ""))
+        if handler is None:
+            self._send(404, {"error": "Неизвестный адрес"})
+            return
+        if body is None:
+            self._send(400, {"error": "Тело запроса должно быть JSON объектом"})
+            return
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            status, payload = getattr(self, handler)(parts[1:], body, query)
+        except Exception as e:
+            print(f"[http_api] Ошибка обработки {method} {url.path}: {e}")
+            status, payload = 500, {"error": "Внутренняя ошибка"}
+        self._send(status, payload)
+
+    def _session(self):
+        """Сессия по токену из заголовка Authorization (None - нет или истекла)."""
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("Bearer "):
+            return None
+        return get_sessions().get(auth[len("Bearer "):])
+
+    def _request(self, service, data):
+        return self.server.bus.request(service, data)
+
+    def _missing(self, body, *fields):
+        """Поля тела, которые не являются непустыми строками."""
+        return [field for field in fields if not isinstance(body.get(field), str) or not body[field].strip()]
+
+    def _register(self, args, body, query):
+        missing = self._missing(body, "username", "password")
+        if missing:
+            return 400, {"error": f"Не заполнены поля: {', '.join(missing)}"}
+        registered = self._request("auth", {
+            "action": "register",
+            "username": body.get("username"),
+            "password": body.get("password"),
+            "email": body.get("email", f"{body.get('username')}@example.com")
+        })
+        if not registered:
+            return 409, {"error": "Пользователь уже существует"}
+        return 201, {"username": body.get("username")}
+
+    def _login(self, args, body, query):
+        missing = self._missing(body, "username", "password")
+        if missing:
+            return 400, {"error": f"Не заполнены поля: {', '.join(missing)}"}
+        session = self._request("auth", {
+            "action": "login",
+            "username": body.get("username"),
+            "password": body.get("password")
+        })
+        if session is None:
+            return 401, {"error": "Неверное имя пользователя или пароль"}
+        return 200, session
+
+    def _logout(self, args, body, query):
+        auth = self.headers.get("Authorization", "")
+        self._request("auth", {"action": "logout", "token": auth[len("Bearer "):]})
+        return 200, {}
+
+    def _view_inventory(self, args, body, query):
+        return 200, {name: {"quantity": item.get("quantity", 0),
+                            "price": item.get("price", 0),
+                            "reserved_total": item.get("reserved_total", 0)}
+                     for name, item in load_inventory().items()}
+
+    def _admin_action(self, action, data):
+        """Выполняет действие склада от имени администратора из сессии."""
+        session = self._session()
+        if session is None:
+            return 401, {"error": "Требуется вход"}
+        if session["role"] != "admin":
+            return 403, {"error": "Требуются права admin"}
+        data = dict(data, action=action, username=session["username"],
+                    token=self.headers["Authorization"][len("Bearer "):])
+        if not self._request("purchase", data):
+            return 400, {"error": "Действие отклонено"}
+        return 200, {"item_name": data["item_name"]}
+
+    def _add_item(self, args, body, query):
+        if self._missing(body, "item_name"):
+            return 400, {"error": "Не заполнены поля: item_name"}
+        return self._admin_action("add_item", {
+            "item_name": body.get("item_name"),
+            "quantity": body.get("quantity"),
+            "price": body.get("price")
+        })
+
+    def _update_item(self, args, body, query):
+        if not args:
+            return 404, {"error": "Не указан товар"}
+        return self._admin_action("update_item", {
+            "item_name": args[0],
+            "quantity": body.get("quantity"),
+            "price": body.get("price")
+        })
+
+    def _remove_item(self, args, body, query):
+        if not args:
+            return 404, {"error": "Не указан товар"}
+        return self._admin_action("remove_item", {"item_name": args[0]})
+
+    def _list_orders(self, args, body, query):
+        session = self._session()
+        if session is None:
+            return 401, {"error": "Требуется вход"}
+        data = {"action": "list_orders", "username": session["username"]}
+        if "status" in query:
+            if session["role"] != "admin":
+                return 403, {"error": "Требуются права admin"}
+            data = {"action": "list_orders", "status": query["status"]}
+        return 200, self._request("order", data)
+
+    def _create_order(self, args, body, query):
+        session = self._session()
+        if session is None:
+            return 401, {"error": "Требуется вход"}
+        items = body.get("items")
+        if not isinstance(items, list) or not all(
+                isinstance(item, dict) and isinstance(item.get("item_name"), str)
+                and isinstance(item.get("quantity"), int) and item["quantity"] > 0 for item in items):
+            return 400, {"error": "items: список {item_name, quantity > 0}"}
+        order_id = self._request("order", {
+            "action": "create_order",
+            "username": session["username"],
+            "items": items,
+            # Повтор запроса клиентом с тем же ключом вернет уже созданный заказ
+            "idempotency_key": self.headers.get("Idempotency-Key")
+        })
+        if order_id is None:
+            return 400, {"error": "Список товаров пуст"}
+        return 201, {"order_id": order_id}
+
+    def _cancel_order(self, args, body, query):
+        session = self._session()
+        if session is None:
+            return 401, {"error": "Требуется вход"}
+        if not args:
+            return 404, {"error": "Не указан заказ"}
+        if not self._request("order", {"action": "cancel_order", "order_id": args[0],
+                                        "username": session["username"]}):
+            return 409, {"error": "Заказ нельзя отменить"}
+        return 200, {"order_id": args[0]}
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Многопоточный HTTP сервер со ссылкой на шину."""
+
+    daemon_threads = True
+
+    def __init__(self, address, bus, quiet=False):
+        super().__init__(address, ApiHandler)
+        self.bus = bus
+        self.quiet = quiet
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP/JSON интерфейс системы")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_runtime_arguments(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = bootstrap(**runtime_options(args))
+    server = ApiServer((args.host, args.port), app["bus"], args.quiet)
+    print(f"HTTP API: http://{args.host}:{args.port}")
+    # SIGTERM - штатная остановка с сохранением данных (как Ctrl+C)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        shutdown(app)
+
+
+if __name__ == "__main__":
+    main()
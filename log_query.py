@@ -0,0 +1,24 @@
+import argparse
+from utils import query_events, EVENTS_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Поиск по структурированному журналу действий")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--order", help="ID заказа")
+    group.add_argument("--user", help="имя пользователя")
+    parser.add_argument("--dir", default=EVENTS_DIR, help="каталог журнала")
+    args = parser.parse_args()
+
+    found = 0
+    for record in query_events(args.dir, order_id=args.order, username=args.user):
+        user_str = f"[{record['user']}]" if record.get("user") else ""
+        details_str = f"- {record['details']}" if record.get("details") else ""
+        print(f"[{record['time']}] {user_str} {record['action']} {details_str}")
+        found += 1
+
+    print(f"Найдено записей: {found}")
+
+
+if __name__ == "__main__":
+    main()
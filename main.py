@@ -1,16 +1,22 @@
-from service_bus import ServiceBus
+import argparse
+import os
+from service_bus import ServiceBus, AsyncServiceBus, AsyncBusRunner, Tracer, DurableEventQueue
 from services.order_services import OrderService, PaymentService, DeliveryService
 from services.inventory_services import InventoryService, PurchaseService
 from services.user_services import AuthService, VerificationService, ProfileService
-from services.notification_services import NotificationService
-from utils import log_action, load_json
+from services.notification_services import NotificationService, NotificationOutbox, NotificationDispatcher, StdoutSink, FileSink, SmtpSink
+from utils import log_action, configure_logging, close_logger, LOG_FILE, EVENTS_DIR
+from storage import get_store, set_store, create_store, DATA_DIR
+from stock import StockTable, get_stock, set_stock
 
 current_user = None
 
-def main():
-    global current_user
-    
-    bus = ServiceBus()
+def build_bus(workers=0, tracer=None, outbox=None, queue=None, async_bus=False):
+    """
+    Создает шину, регистрирует сервисы и подписки на события.
+    async_bus - асинхронная шина с очередями сервисов (AsyncServiceBus в отдельном потоке).
+    """
+    bus = AsyncServiceBus() if async_bus else ServiceBus(workers, tracer, queue)
     
     # Регистрация сервисов
     bus.register_service("order", OrderService())
@@ -21,7 +27,7 @@ def main():
     bus.register_service("auth", AuthService())
     bus.register_service("verify", VerificationService())
     bus.register_service("profile", ProfileService())
-    bus.register_service("notify", NotificationService())
+    bus.register_service("notify", NotificationService(outbox))
     
     # Подписки на события
     bus.subscribe("user_registered", "verify")
@@ -29,20 +35,100 @@ def main():
     bus.subscribe("profile_created", "notify")
     
     bus.subscribe("order_created", "inventory")
-    bus.subscribe("order_created", "payment")
+    # Оплата проверяет, не отклонил ли склад заказ, поэтому идет после резервирования
+    bus.subscribe("order_created", "payment", after="inventory")
     
     bus.subscribe("all_items_reserved", "notify")
     bus.subscribe("item_reserved", "notify")
+    bus.subscribe("reservation_failed", "notify")
     
     bus.subscribe("payment_done", "notify")
     bus.subscribe("payment_done", "delivery")
     
     bus.subscribe("delivery_scheduled", "notify")
+    bus.subscribe("delivery_scheduled", "inventory")
+    
+    bus.subscribe("order_cancelled", "inventory")
+    bus.subscribe("order_cancelled", "notify")
     
     bus.subscribe("item_added", "notify")
     bus.subscribe("item_updated", "notify")
     bus.subscribe("item_removed", "notify")
     
+    return AsyncBusRunner(bus) if async_bus else bus
+
+
+def create_outbox(window, sinks, smtp="localhost:1025", delivery_workers=0, smtp_limit=2, retries=3):
+    """
+    Создает накопитель уведомлений с выбранными способами доставки.
+    При delivery_workers > 0 доставка выполняется пулом потоков NotificationDispatcher.
+    """
+    host, port = smtp.rsplit(":", 1)
+    factories = {
+        "stdout": StdoutSink,
+        "file": FileSink,
+        "smtp": lambda: SmtpSink(host, int(port))
+    }
+    sinks = [factories[name]() for name in sinks]
+    if delivery_workers > 0:
+        # Консоль и файл - по одному потоку, чтобы дайджесты не перемешивались
+        limits = {"stdout": 1, "file": 1, "smtp": smtp_limit}
+        sinks = [NotificationDispatcher(sinks, delivery_workers, limits, retries)]
+    return NotificationOutbox(sinks, window)
+
+
+def bootstrap(storage="json", flush_interval=0, workers=0, quiet=False, trace=None, shared=False, stock=False,
+              notify_window=0, notify_sinks=("stdout",), smtp="localhost:1025",
+              delivery_workers=0, smtp_limit=2, retries=3, durable_events=False, async_bus=False,
+              data_dir=DATA_DIR, log_path=LOG_FILE, events_dir=EVENTS_DIR):
+    """
+    Настраивает журнал действий, хранилище, доставку уведомлений и шину.
+    data_dir, log_path, events_dir - каталог данных и файлы журнала (бенчмарк
+    направляет их во временный каталог).
+    С durable_events события сохраняются в data/events, неподтвержденные
+    до остановки события доставляются повторно при запуске.
+    С async_bus используется асинхронная шина (workers, trace и durable_events не поддерживаются).
+    Возвращает окружение {"bus", "outbox", "tracer", "trace"} для shutdown.
+    """
+    configure_logging(log_path, echo=not quiet, events_dir=events_dir)
+    set_store(create_store(storage, data_dir, flush_interval=flush_interval, shared=shared))
+    if stock:
+        set_stock(StockTable(data_dir))
+        if get_stock().is_new:
+            get_stock().import_inventory(get_store().all("inventory"))
+    if async_bus and (workers or trace or durable_events):
+        print("Асинхронная шина: параметры --workers, --trace и --durable-events не используются")
+        workers, trace, durable_events = 0, None, False
+    tracer = Tracer() if trace else None
+    outbox = None
+    if notify_window > 0 or delivery_workers > 0:
+        outbox = create_outbox(notify_window, notify_sinks, smtp, delivery_workers, smtp_limit, retries)
+    queue = DurableEventQueue(os.path.join(data_dir, "events")) if durable_events else None
+    bus = build_bus(workers, tracer, outbox, queue, async_bus)
+    if durable_events:
+        bus.recover()
+    return {"bus": bus, "outbox": outbox, "tracer": tracer, "trace": trace}
+
+
+def shutdown(app):
+    """Дожидается обработки событий и сбрасывает отложенные изменения на диск."""
+    app["bus"].shutdown()
+    if app["outbox"]:
+        app["outbox"].close()
+    set_stock(None)
+    set_store(None)
+    close_logger()
+    if app["tracer"]:
+        app["tracer"].export(app["trace"])
+
+
+def main(*args, **kwargs):
+    """Консольное меню; параметры - как у bootstrap."""
+    global current_user
+    
+    app = bootstrap(*args, **kwargs)
+    bus = app["bus"]
+    
     print("="*60)
     print("СИСТЕМА УПРАВЛЕНИЯ ПОЛЬЗОВАТЕЛЯМИ И СКЛАДОМ")
     print("="*60)
@@ -80,6 +166,8 @@ def main():
             print("2. Управлять складом")
             print("3. Создать заказ")
             print("4. Выйти из аккаунта")
+            print("5. Мои заказы")
+            print("6. Заказы по статусу")
             print("0. Выход")
             
             choice = input("\nВведите номер действия: ").strip()
@@ -91,9 +179,15 @@ def main():
             elif choice == "3":
                 create_order(bus)
             elif choice == "4":
+                bus.request("auth", {"action": "logout", "token": current_user["token"]})
                 log_action("ВЫХОД", user=current_user['username'])
                 print(f"Пользователь {current_user['username']} вышел из системы")
                 current_user = None
+            elif choice == "5":
+                view_orders(bus, username=current_user["username"])
+            elif choice == "6":
+                status = input("Введите статус (created, paid, in_delivery, rejected): ").strip()
+                view_orders(bus, status=status)
             elif choice == "0":
                 print("\n" + "="*60)
                 print("Выход из системы... До свидания!")
@@ -106,6 +200,7 @@ def main():
             print("1. Просмотреть склад")
             print("2. Создать заказ")
             print("3. Выйти из аккаунта")
+            print("4. Мои заказы")
             print("0. Выход")
             
             choice = input("\nВведите номер действия: ").strip()
@@ -115,9 +210,12 @@ def main():
             elif choice == "2":
                 create_order(bus)
             elif choice == "3":
+                bus.request("auth", {"action": "logout", "token": current_user["token"]})
                 log_action("ВЫХОД", user=current_user['username'])
                 print(f"Пользователь {current_user['username']} вышел из системы")
                 current_user = None
+            elif choice == "4":
+                view_orders(bus, username=current_user["username"])
             elif choice == "0":
                 print("\n" + "="*60)
                 print("Выход из системы... До свидания!")
@@ -125,6 +223,8 @@ def main():
                 break
             else:
                 print("Некорректный выбор, попробуйте снова.")
+    
+    shutdown(app)
 
 def register_user(bus):
     print("\n" + "-"*60)
@@ -168,28 +268,19 @@ def login_user(bus):
     username = input("Введите имя пользователя: ").strip()
     password = input("Введите пароль: ").strip()
     
-    users = load_json("data/users.json")
-    
-    if username not in users:
-        print(f"Ошибка: Пользователь '{username}' не найден.")
-        return
-    
-    if password != users[username]["password"]:
-        print("Ошибка: Неверный пароль.")
-        return
-    
-    current_user = {
-        "username": username,
-        "role": users[username]["role"],
-        "email": users[username].get("email")
-    }
-    
-    bus.send("auth", {
+    # Проверка пароля и выдача токена сессии - в AuthService
+    session = bus.request("auth", {
         "action": "login",
         "username": username,
         "password": password
     })
     
+    if session is None:
+        print("Ошибка: Неверное имя пользователя или пароль.")
+        return
+    
+    current_user = session
+    
     print(f"\n Добро пожаловать, {username}! Роль: {current_user['role']}")
 
 
@@ -238,6 +329,7 @@ def add_item(bus):
     bus.send("purchase", {
         "action": "add_item",
         "username": current_user["username"],
+        "token": current_user["token"],
         "item_name": item_name,
         "quantity": quantity,
         "price": price
@@ -248,7 +340,7 @@ def update_item(bus):
     print("\n--- Обновление товара ---")
     
     # Показываем текущий склад
-    inventory = load_json("data/inventory.json")
+    inventory = load_inventory()
     if not inventory:
         print("Склад пуст")
         return
@@ -272,6 +364,7 @@ def update_item(bus):
         data = {
             "action": "update_item",
             "username": current_user["username"],
+            "token": current_user["token"],
             "item_name": item_name
         }
         
@@ -290,7 +383,7 @@ def update_item(bus):
 def remove_item(bus):
     print("\n--- Удаление товара ---")
     
-    inventory = load_json("data/inventory.json")
+    inventory = load_inventory()
     if not inventory:
         print("Склад пуст")
         return
@@ -307,18 +400,26 @@ def remove_item(bus):
         bus.send("purchase", {
             "action": "remove_item",
             "username": current_user["username"],
+            "token": current_user["token"],
             "item_name": item_name
         })
     else:
         print("Удаление отменено")
 
 
+def load_inventory():
+    """Склад из хранилища; с движком остатков - с актуальными остатками из него."""
+    inventory = get_store().all("inventory")
+    stock = get_stock()
+    return stock.overlay(inventory) if stock is not None else inventory
+
+
 def view_inventory():
     print("\n" + "-"*60)
     print("ТЕКУЩИЙ СКЛАД")
     print("-"*60)
     
-    inventory = load_json("data/inventory.json")
+    inventory = load_inventory()
     
     if not inventory:
         print("Склад пуст")
@@ -330,7 +431,7 @@ def view_inventory():
     for item_name, details in inventory.items():
         quantity = details.get("quantity", 0)
         price = details.get("price", 0)
-        reserved_total = sum([r.get("quantity", 0) for r in details.get("reserved", [])])
+        reserved_total = details.get("reserved_total", 0)
         
         status = f"{quantity} шт."
         if reserved_total > 0:
@@ -341,13 +442,37 @@ def view_inventory():
     print("-"*60)
 
 
+def view_orders(bus, username=None, status=None):
+    print("\n" + "-"*60)
+    print("ЗАКАЗЫ")
+    print("-"*60)
+    
+    orders = bus.request("order", {
+        "action": "list_orders",
+        "username": username,
+        "status": status
+    })
+    
+    if not orders:
+        print("Заказы не найдены")
+        return
+    
+    print(f"\n{'ID':<12} {'Пользователь':<15} {'Статус':<15} {'Сумма':<15}")
+    print("-"*60)
+    
+    for order_id, order in orders.items():
+        print(f"{order_id:<12} {order['username']:<15} {order['status']:<15} {order['total']:<15.2f} руб.")
+    
+    print("-"*60)
+
+
 def create_order(bus):
     print("\n" + "-"*60)
     print("СОЗДАНИЕ ЗАКАЗА")
     print("-"*60)
     
     # Показываем доступные товары
-    inventory = load_json("data/inventory.json")
+    inventory = load_inventory()
     
     if not inventory:
         print("Склад пуст. Невозможно создать заказ")
@@ -417,5 +542,66 @@ def create_order(bus):
         })
 
 
+def add_runtime_arguments(parser):
+    """Добавляет аргументы командной строки для bootstrap."""
+    parser.add_argument("--storage", choices=["json", "journal", "sharded", "sqlite"], default="json",
+                        help="режим хранения данных")
+    parser.add_argument("--flush-interval", type=float, default=0,
+                        help="минимальный интервал записи на диск, сек")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="число потоков параллельной обработки событий (0 - последовательно)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="не выводить записи журнала действий в консоль")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="сохранить трассы цепочек событий в FILE (формат Trace Event)")
+    parser.add_argument("--shared", action="store_true",
+                        help="каталог data используется несколькими процессами: перечитывать измененные файлы (только --storage json)")
+    parser.add_argument("--stock", action="store_true",
+                        help="вести остатки товаров в отображаемом в память файле data/stock.bin")
+    parser.add_argument("--notify-window", type=float, default=0,
+                        help="окно объединения уведомлений в дайджест, сек (0 - отправлять сразу)")
+    parser.add_argument("--notify-sink", action="append", choices=["stdout", "file", "smtp"],
+                        help="способ доставки дайджестов (можно указать несколько, по умолчанию stdout)")
+    parser.add_argument("--smtp", default="localhost:1025",
+                        help="адрес SMTP сервера для доставки smtp (HOST:PORT)")
+    parser.add_argument("--delivery-workers", type=int, default=0,
+                        help="число потоков доставки уведомлений (0 - доставка в потоке события)")
+    parser.add_argument("--smtp-limit", type=int, default=2,
+                        help="максимум одновременных SMTP соединений")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="число повторов доставки при ошибке")
+    parser.add_argument("--async-bus", action="store_true",
+                        help="асинхронная шина: очередь на каждый сервис, отправитель не ждет цепочку событий")
+    parser.add_argument("--durable-events", action="store_true",
+                        help="сохранять события в data/events и доставлять неподтвержденные после перезапуска")
+
+
+def runtime_options(args):
+    """Параметры bootstrap из разобранных аргументов командной строки."""
+    return {
+        "storage": args.storage,
+        "flush_interval": args.flush_interval,
+        "workers": args.workers,
+        "quiet": args.quiet,
+        "trace": args.trace,
+        "shared": args.shared,
+        "stock": args.stock,
+        "notify_window": args.notify_window,
+        "notify_sinks": args.notify_sink or ["stdout"],
+        "smtp": args.smtp,
+        "delivery_workers": args.delivery_workers,
+        "smtp_limit": args.smtp_limit,
+        "retries": args.retries,
+        "durable_events": args.durable_events,
+        "async_bus": args.async_bus
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Система управления пользователями и складом")
+    add_runtime_arguments(parser)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(**runtime_options(parse_args()))
\ No newline at end of file
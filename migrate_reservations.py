@@ -0,0 +1,51 @@
+import argparse
+from storage import create_store
+
+# Статусы заказов, резервы которых еще активны
+ACTIVE_STATUSES = ("created", "paid")
+
+
+def migrate(store):
+    """
+    Переводит резервы товаров из списка [{order_id, quantity}] в журнал
+    {order_id: количество} и пересчитывает reserved_total.
+    Резервы заказов, которые уже отправлены в доставку или отменены, удаляются.
+    """
+    migrated = 0
+    for item_name in list(store.all("inventory")):
+        item = store.get("inventory", item_name)
+        reserved = item.get("reserved", [])
+        if isinstance(reserved, dict):
+            entries = reserved.items()
+        else:
+            entries = [(r["order_id"], r["quantity"]) for r in reserved]
+
+        ledger = {}
+        for order_id, quantity in entries:
+            order = store.get("orders", order_id)
+            if order is not None and order["status"] in ACTIVE_STATUSES:
+                ledger[order_id] = ledger.get(order_id, 0) + quantity
+
+        item["reserved"] = ledger
+        item["reserved_total"] = sum(ledger.values())
+        store.put("inventory", item_name, item)
+        migrated += 1
+
+    store.flush()
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сжатие резервов товаров на складе")
+    parser.add_argument("--storage", choices=["json", "journal", "sharded", "sqlite"], default="json",
+                        help="режим хранения данных")
+    args = parser.parse_args()
+
+    store = create_store(args.storage)
+    migrated = migrate(store)
+    store.close()
+    print(f"Обработано товаров: {migrated}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from main import add_runtime_arguments, bootstrap, runtime_options, shutdown
+
+
+def read_requests(stream):
+    """
+    Читает записи запросов из JSON Lines потока.
+    Формат строки: {"service": "order", "action": "create_order", ...};
+    поле service - сервис-получатель, остальные поля передаются в bus.send.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            print(f"[replay] Пропущена некорректная строка: {line[:80]}", file=sys.stderr)
+            continue
+        service = record.pop("service", None)
+        if not service:
+            print(f"[replay] Пропущена запись без поля service: {line[:80]}", file=sys.stderr)
+            continue
+        yield service, record
+
+
+def percentile(values, p):
+    """Перцентиль по методу ближайшего ранга (values отсортирован)."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * p // 100))
+    return values[int(rank) - 1]
+
+
+def replay(bus, requests, concurrency=1):
+    """
+    Отправляет запросы в шину с заданным числом параллельных потоков.
+    Ошибка обработки запроса не прерывает прогон: запрос учитывается в числе ошибок.
+    Возвращает (количество успешных запросов, количество ошибок, общее время, задержки в секундах).
+    """
+    latencies = []
+    errors = []
+
+    def run(service, data):
+        start = time.perf_counter()
+        try:
+            bus.request(service, data)
+        except Exception as e:
+            errors.append(e)
+            print(f"[replay] Ошибка запроса к '{service}': {e!r}", file=sys.stderr)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+        for service, data in requests:
+            # Ограничиваем число задач в очереди, чтобы не читать весь файл в память
+            if len(in_flight) >= concurrency * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(run, service, data))
+        for future in in_flight:
+            future.result()
+    elapsed = time.perf_counter() - started
+    return len(latencies), len(errors), elapsed, sorted(latencies)
+
+
+def print_report(count, errors, elapsed, latencies):
+    print("=" * 60)
+    print("РЕЗУЛЬТАТЫ ПРОГОНА")
+    print("=" * 60)
+    print(f"Запросов: {count}")
+    print(f"Ошибок: {errors}")
+    print(f"Время: {elapsed:.3f} с")
+    print(f"Пропускная способность: {count / elapsed if elapsed else 0:.1f} запр./с")
+    for p in (50, 90, 99):
+        print(f"p{p}: {percentile(latencies, p) * 1000:.2f} мс")
+    print(f"max: {(latencies[-1] if latencies else 0) * 1000:.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Неинтерактивный прогон запросов через шину сервисов")
+    parser.add_argument("input", help="файл JSON Lines с запросами ('-' - stdin)")
+    parser.add_argument("--concurrency", type=int, default=1, help="число параллельных запросов")
+    add_runtime_arguments(parser)
+    args = parser.parse_args()
+
+    stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output = open(os.devnull, "w") if args.quiet else sys.stdout
+    with stream, contextlib.redirect_stdout(output):
+        app = bootstrap(**runtime_options(args))
+        result = replay(app["bus"], read_requests(stream), args.concurrency)
+        shutdown(app)
+
+    print_report(*result)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,366 @@
+import asyncio
+import collections
+import glob
+import json
+import os
+import queue
+import threading
+import time
+import types
+import uuid
+from storage import DATA_DIR, get_store
+
+
+class Tracer:
+    """
+    Трассировка цепочек событий: для каждого вызова handle записывается span
+    (сервис, событие, время начала и окончания, trace_id внешнего вызова).
+    Экспорт в формате Trace Event (chrome://tracing, Perfetto).
+    - max_spans: сколько последних span хранить в памяти
+    """
+
+    def __init__(self, max_spans=100000):
+        self.spans = collections.deque(maxlen=max_spans)
+        self.origin = time.perf_counter()
+
+    def new_trace_id(self):
+        return uuid.uuid4().hex[:16]
+
+    def add_span(self, trace_id, service, event, start, end):
+        self.spans.append({
+            "name": f"{service}:{event}",
+            "cat": service,
+            "ph": "X",
+            "ts": (start - self.origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"trace_id": trace_id, "service": service, "event": event}
+        })
+
+    def export(self, path):
+        """Сохраняет собранные span в файл."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": list(self.spans), "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+class PartitionedExecutor:
+    """
+    Пул потоков с разбиением по ключу: задачи с одинаковым ключом
+    выполняются в одном потоке строго по порядку, с разными - параллельно.
+    """
+
+    def __init__(self, workers):
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.threads = []
+        for q in self.queues:
+            thread = threading.Thread(target=self._run, args=(q,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self, q):
+        while True:
+            task = q.get()
+            if task is None:
+                q.task_done()
+                return
+            fn, args = task
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"[ServiceBus] Ошибка обработки: {e}")
+            finally:
+                q.task_done()
+
+    def submit(self, key, fn, *args):
+        self.queues[hash(key) % len(self.queues)].put((fn, args))
+
+    def join(self):
+        """Ждет выполнения всех поставленных задач."""
+        for q in self.queues:
+            q.join()
+
+    def shutdown(self):
+        for q in self.queues:
+            q.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class DurableEventQueue:
+    """
+    Очередь событий на диске. Событие дописывается в текущий сегмент events-<offset>.log
+    вместе со списком подписчиков; подписчик подтверждает обработку записью
+    [service, offset] в acks-<offset>.log текущего сегмента. В имени сегмента - смещение
+    его первого события: смещения только растут и не повторяются после удаления
+    старых сегментов.
+    Запись согласована с хранилищем (Store.add_flush_listener):
+    - before_flush: перед записью изменений хранилища события фиксируются на диске,
+      поэтому изменения не оказываются на диске раньше порожденных ими событий;
+    - after_flush: подтверждения, полученные до записи хранилища, дописываются
+      только после нее - событие не подтверждается раньше изменений его обработчика;
+      на диске они фиксируются следующим before_flush (или close).
+    Групповая фиксация: sync выполняет один fsync для всех событий и подтверждений,
+    добавленных к этому моменту всеми потоками; потоки, ожидавшие своей очереди,
+    обычно уже покрыты fsync предыдущего потока.
+    При запуске неподтвержденные события возвращаются pending() для повторной доставки.
+    - segment_bytes: размер сегмента, после которого начинается новый; старые сегменты,
+      все события которых подтверждены, удаляются
+    - outstanding: неподтвержденные доставки {segment: {offset: set(services)}}
+    - unflushed: подтверждения, ожидающие записи хранилища; ready - уже покрытые ею
+    - unsynced: записанные подтверждения до fsync; durable - после fsync
+      (шина удаляет по ним отметки доставок, см. ServiceBus)
+    """
+
+    def __init__(self, queue_dir=os.path.join(DATA_DIR, "events"), segment_bytes=16 * 1024 * 1024):
+        self.queue_dir = queue_dir
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        self.outstanding = {}
+        self.segment_of = {}
+        self.recovered = {}
+        self.unflushed = []
+        self.ready = []
+        self.unsynced = []
+        self.durable = []
+        os.makedirs(queue_dir, exist_ok=True)
+        self.segments = sorted(int(os.path.basename(path)[len("events-"):-len(".log")])
+                               for path in glob.glob(os.path.join(queue_dir, "events-*.log")))
+        self.next_offset = self.segments[-1] if self.segments else 0
+        for segment in self.segments:
+            self._replay_events(segment)
+        for segment in self.segments:
+            self._replay_acks(segment)
+        if not self.segments:
+            self.segments = [0]
+        self.segment = self.segments[-1]
+        self._open()
+        self.written = 0
+        self.synced = 0
+        self._drop_acked()
+
+    def _path(self, kind, segment):
+        return os.path.join(self.queue_dir, f"{kind}-{segment:012d}.log")
+
+    def _read_lines(self, path):
+        """Читает записи файла; недописанный при сбое хвост отрезается."""
+        records = []
+        if not os.path.exists(path):
+            return records
+        valid_size = 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                valid_size += len(line)
+        os.truncate(path, valid_size)
+        return records
+
+    def _replay_events(self, segment):
+        for record in self._read_lines(self._path("events", segment)):
+            offset = record["o"]
+            self.outstanding.setdefault(segment, {})[offset] = set(record["s"])
+            self.segment_of[offset] = segment
+            self.recovered[offset] = (record["e"], record["d"])
+            self.next_offset = max(self.next_offset, offset + 1)
+
+    def _replay_acks(self, segment):
+        for service, offset in self._read_lines(self._path("acks", segment)):
+            self._discard(service, offset)
+
+    def _discard(self, service, offset):
+        segment = self.segment_of.get(offset)
+        if segment is None:
+            return
+        services = self.outstanding[segment][offset]
+        services.discard(service)
+        if not services:
+            del self.outstanding[segment][offset]
+            del self.segment_of[offset]
+            self.recovered.pop(offset, None)
+
+    def _open(self):
+        self.events = open(self._path("events", self.segment), "ab")
+        self.acks = open(self._path("acks", self.segment), "ab")
+
+    def _rotate(self):
+        for f in (self.events, self.acks):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        self.segment = self.next_offset
+        self.segments.append(self.segment)
+        self._open()
+
+    def _drop_acked(self):
+        """Удаляет старые сегменты, все события которых (и предыдущих сегментов) подтверждены."""
+        while len(self.segments) > 1 and not self.outstanding.get(self.segments[0]):
+            segment = self.segments.pop(0)
+            self.outstanding.pop(segment, None)
+            for kind in ("events", "acks"):
+                if os.path.exists(self._path(kind, segment)):
+                    os.remove(self._path(kind, segment))
+
+    def append(self, event_name, data, services):
+        """Дописывает событие (без fsync), возвращает его смещение."""
+        with self.lock:
+            offset = self.next_offset
+            self.next_offset += 1
+            record = {"o": offset, "e": event_name, "d": data, "s": services}
+            self.events.write((json.dumps(record, ensure_ascii=False, default=dict) + "\n").encode("utf-8"))
+            self.outstanding.setdefault(self.segment, {})[offset] = set(services)
+            self.segment_of[offset] = self.segment
+            self.written += 1
+            if self.events.tell() >= self.segment_bytes:
+                self._rotate()
+            return offset
+
+    def sync(self):
+        """Групповая фиксация: гарантирует, что добавленные к этому моменту события и подтверждения на диске."""
+        target = self.written
+        with self.sync_lock:
+            if self.synced >= target:
+                return
+            with self.lock:
+                self.events.flush()
+                self.acks.flush()
+                synced = self.written
+                acked, self.unsynced = self.unsynced, []
+                fds = [os.dup(self.events.fileno()), os.dup(self.acks.fileno())]
+            # fsync вне self.lock: остальные потоки продолжают добавлять события
+            for fd in fds:
+                os.fsync(fd)
+                os.close(fd)
+            self.synced = synced
+            with self.lock:
+                self.durable.extend(acked)
+
+    def ack(self, deliveries):
+        """Подтверждает доставки [(service, offset)] после следующей записи хранилища."""
+        with self.lock:
+            self.unflushed.extend(deliveries)
+
+    def before_flush(self):
+        with self.lock:
+            self.ready.extend(self.unflushed)
+            self.unflushed = []
+        self.sync()
+
+    def after_flush(self):
+        with self.lock:
+            if not self.ready:
+                return
+            self.acks.write("".join(json.dumps([service, offset], ensure_ascii=False) + "\n"
+                                    for service, offset in self.ready).encode("utf-8"))
+            # Без буфера процесса: подтверждения переживают аварийное завершение процесса
+            self.acks.flush()
+            self.written += len(self.ready)
+            for service, offset in self.ready:
+                self._discard(service, offset)
+            self.unsynced.extend(self.ready)
+            self.ready = []
+            self._drop_acked()
+
+    def take_durable(self):
+        """Возвращает и забывает подтверждения, зафиксированные на диске: [(service, offset)]."""
+        with self.lock:
+            durable, self.durable = self.durable, []
+            return durable
+
+    def pending(self):
+        """Неподтвержденные события после перезапуска: [(offset, event_name, data, services)]."""
+        with self.lock:
+            return [(offset, event_name, data, sorted(self.outstanding[self.segment_of[offset]][offset]))
+                    for offset, (event_name, data) in sorted(self.recovered.items())]
+
+    def close(self):
+        with self.lock:
+            for f in (self.events, self.acks):
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+
+
+_MISSING = object()
+
+
+class Event:
+    """
+    Событие шины: неизменяемый объект, который без копирования передается
+    всем подписчикам. Поддерживает чтение как словарь (get, []), поэтому
+    обработчики работают с ним так же, как с payload команд.
+    Служебные поля _event_type и _trace_id берутся из атрибутов события.
+    """
+
+    __slots__ = ("name", "data", "trace_id")
+
+    def __init__(self, name, data, trace_id=None):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "data", types.MappingProxyType(data))
+        object.__setattr__(self, "trace_id", trace_id)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Event is immutable")
+
+    def get(self, key, default=None):
+        if key == "_event_type":
+            return self.name
+        if key == "_trace_id":
+            return self.trace_id
+        return self.data.get(key, default)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return key in ("_event_type", "_trace_id") or key in self.data
+
+    def __repr__(self):
+        return f"Event({self.name!r}, {dict(self.data)!r})"
+
+
 class ServiceBus:
     """
     - services: словарь зарегистрированных сервисов {name: service_instance}
     - subscribers: словарь подписок на события {event_name: [service_name1, service_name2]}
+    - routes: таблица маршрутизации событий {event_name: [(service_name, handler)]}
+    - action_routes: таблица команд {service_name: {action: handler}}
+      Таблицы строятся при регистрации и подписке по ACTIONS/EVENTS сервисов;
+      для сервисов без таблиц используется handle.
+    - local.depth: глубина вложенности вызовов в потоке; внешний вызов - граница транзакции хранилища
+    - executor: пул потоков для параллельной обработки (workers > 0)
+    - tracer: трассировка цепочек событий (None - выключена); trace_id назначается
+      внешнему вызову send и передается производным событиям
+    - queue: очередь событий на диске (DurableEventQueue, None - события только в памяти);
+      события фиксируются до изменений хранилища, подтверждения - после,
+      поэтому после сбоя неподтвержденные события доставляются повторно (recover)
+    - отметки доставок: обработка события из очереди отмечается в таблице deliveries
+      хранилища в той же транзакции, что и изменения обработчика; если подтверждение
+      не успело попасть на диск, recover по отметке не выполняет обработчик второй раз.
+      Отметка удаляется, когда подтверждение зафиксировано на диске
     """
 
-    def __init__(self):
+    DELIVERIES = "deliveries"
+
+    def __init__(self, workers=0, tracer=None, queue=None):
         self.services = {}
         self.subscribers = {}
+        self.routes = {}
+        self.action_routes = {}
+        self.local = threading.local()
+        self.executor = PartitionedExecutor(workers) if workers > 0 else None
+        self.tracer = tracer
+        self.queue = queue
+        if queue is not None:
+            get_store().add_flush_listener(queue)
 
     def register_service(self, name, service):
         """
@@ -14,35 +368,405 @@ class ServiceBus:
         """
         self.services[name] = service
         service.bus = self  # сервис может публиковать события через шину
+        actions = getattr(service, "ACTIONS", None)
+        if actions is not None:
+            self.action_routes[name] = {action: getattr(service, method) for action, method in actions.items()}
+        self._compile_routes()
 
-    def subscribe(self, event_name, service_name):
+    def subscribe(self, event_name, service_name, after=None):
         """
         Подписывает сервис на событие.
+        Подписчики вызываются по очереди в порядке подписки, поэтому
+        условие after (см. AsyncServiceBus.subscribe) выполняется, если
+        сервис after подписан раньше.
         """
         if event_name not in self.subscribers:
             self.subscribers[event_name] = []
         self.subscribers[event_name].append(service_name)
+        self._compile_routes()
+
+    def _compile_routes(self):
+        """Строит таблицу событий: подписчик -> метод-обработчик."""
+        routes = {}
+        for event_name, service_names in self.subscribers.items():
+            handlers = []
+            for service_name in service_names:
+                service = self.services.get(service_name)
+                if service is None:
+                    continue
+                events = getattr(service, "EVENTS", None)
+                if events is None:
+                    handlers.append((service_name, service.handle))
+                elif event_name in events:
+                    handlers.append((service_name, getattr(service, events[event_name])))
+            routes[event_name] = handlers
+        self.routes = routes
 
     def publish(self, event_name, data):
         """
-        Публикует событие: уведомляет все подписанные сервисы.
-        Добавляет имя события в данные для контекста (_event_type).
+        Публикует событие: один объект Event передается всем подписанным сервисам.
         """
-        # Создаем обогащенный payload с именем события
-        payload = data.copy()
-        payload['_event_type'] = event_name
+        event = Event(event_name, data, getattr(self.local, "trace_id", None) if self.tracer else None)
 
         print(f"\n[ServiceBus] Событие '{event_name}' опубликовано с данными: {data}")
-        if event_name in self.subscribers:
-            for service_name in self.subscribers[event_name]:
-                # Отправляем обогащенный payload
-                self.send(service_name, payload)
+        routes = self.routes.get(event_name, ())
+        offset = None
+        if self.queue is not None and routes:
+            offset = self.queue.append(event_name, data, [service_name for service_name, _ in routes])
+        for service_name, handler in routes:
+            self._deliver(service_name, handler, event, offset)
+
+    def _deliver(self, service_name, handler, event, offset):
+        """
+        Доставляет событие подписчику. Ошибка подписчика не прерывает доставку
+        остальным и не отменяет обработку у отправителя; событие остается
+        неподтвержденным для этого подписчика (с очередью на диске - повторная доставка).
+        """
+        try:
+            self._route(service_name, handler, event, offset)
+        except Exception as e:
+            print(f"[ServiceBus] Ошибка обработки события '{event.name}' сервисом '{service_name}': {e}")
+
+    def recover(self):
+        """Повторно доставляет события, не подтвержденные подписчиками до остановки."""
+        if self.queue is None:
+            return 0
+        store = get_store()
+        pending = self.queue.pending()
+        # Отметки подтвержденных на диске доставок больше не нужны
+        outstanding = {self._delivery_key(service_name, offset)
+                       for offset, _, _, services in pending for service_name in services}
+        for key in list(store.all(self.DELIVERIES)):
+            if key not in outstanding:
+                store.delete(self.DELIVERIES, key)
+        store.commit()
+        for offset, event_name, data, services in pending:
+            handlers = dict(self.routes.get(event_name, ()))
+            for service_name in services:
+                handler = handlers.get(service_name)
+                if handler is None or store.get(self.DELIVERIES, self._delivery_key(service_name, offset)):
+                    # Подписка снята или обработка уже зафиксирована в хранилище -
+                    # подтверждение не успело попасть на диск
+                    self.queue.ack([(service_name, offset)])
+                    continue
+                print(f"[ServiceBus] Повторная доставка '{event_name}' сервису '{service_name}'")
+                self._deliver(service_name, handler, Event(event_name, data), offset)
+        self.wait()
+        store.flush()
+        return len(pending)
+
+    def _delivery_key(self, service_name, offset):
+        return f"{service_name}:{offset}"
 
     def send(self, target_service, data):
         """
-        Отправляет данные конкретному сервису (вызывает handle).
+        Отправляет данные конкретному сервису.
+        В параллельном режиме внешний вызов ставится в очередь пула
+        по ключу order_id (или username); производные события обрабатываются
+        в том же потоке, поэтому события одного заказа упорядочены.
+        """
+        handler = self._resolve(target_service, data)
+        if handler is None:
+            return
+        return self._route(target_service, handler, data)
+
+    def request(self, target_service, data):
+        """
+        Синхронный запрос к сервису: выполняется в текущем потоке
+        в любом режиме и возвращает результат обработчика.
         """
+        handler = self._resolve(target_service, data)
+        if handler is None:
+            return
+        return self._invoke(target_service, handler, data)
+
+    def _resolve(self, target_service, data):
+        """Находит обработчик команды по таблице действий сервиса."""
         if target_service not in self.services:
             print(f"[ServiceBus] Ошибка: сервис '{target_service}' не найден.")
+            return None
+        actions = self.action_routes.get(target_service)
+        if actions is not None and data.get("action") in actions:
+            return actions[data.get("action")]
+        return self.services[target_service].handle
+
+    def _route(self, target_service, handler, data, offset=None):
+        if self.executor and not getattr(self.local, "depth", 0):
+            key = data.get("order_id") or data.get("username")
+            self.executor.submit(key, self._invoke, target_service, handler, data, offset)
             return
-        self.services[target_service].handle(data)
\ No newline at end of file
+        return self._invoke(target_service, handler, data, offset)
+
+    def _invoke(self, target_service, handler, data, offset=None):
+        """
+        Вызывает обработчик сервиса.
+        После успешного завершения внешнего вызова фиксирует изменения в хранилище
+        и подтверждает обработанные цепочкой события (запись подтверждений
+        очередь выполняет после записи хранилища).
+        """
+        depth = getattr(self.local, "depth", 0)
+        if depth == 0 and self.queue is not None:
+            self.local.acks = []
+        if self.tracer:
+            if depth == 0:
+                self.local.trace_id = data.get("_trace_id") or self.tracer.new_trace_id()
+            start = time.perf_counter()
+        self.local.depth = depth + 1
+        failed = True
+        try:
+            result = handler(data)
+            if offset is not None:
+                get_store().put(self.DELIVERIES, self._delivery_key(target_service, offset),
+                                {"service": target_service, "offset": offset})
+                self.local.acks.append((target_service, offset))
+            failed = False
+            return result
+        finally:
+            self.local.depth = depth
+            if self.tracer:
+                self.tracer.add_span(self.local.trace_id, target_service,
+                                     data.get("_event_type") or data.get("action"),
+                                     start, time.perf_counter())
+            # Цепочка, завершившаяся исключением, не фиксируется
+            if depth == 0 and failed:
+                get_store().rollback()
+            elif depth == 0:
+                if self.tracer:
+                    start = time.perf_counter()
+                if self.queue is not None:
+                    for service_name, acked in self.queue.take_durable():
+                        get_store().delete(self.DELIVERIES, self._delivery_key(service_name, acked))
+                get_store().commit()
+                if self.queue is not None and self.local.acks:
+                    self.queue.ack(self.local.acks)
+                if self.tracer:
+                    self.tracer.add_span(self.local.trace_id, "store", "commit", start, time.perf_counter())
+
+    def wait(self):
+        """Ждет обработки всех событий, поставленных в пул."""
+        if self.executor:
+            self.executor.join()
+
+    def shutdown(self):
+        """Дожидается обработки событий и останавливает пул потоков."""
+        if self.executor:
+            self.executor.join()
+            self.executor.shutdown()
+            self.executor = None
+        if self.queue is not None:
+            # Последняя запись хранилища записывает и оставшиеся подтверждения
+            store = get_store()
+            store.flush()
+            store.remove_flush_listener(self.queue)
+            self.queue.close()
+            self.queue = None
+
+
+class SyncHandlerAdapter:
+    """
+    Адаптер синхронного сервиса для AsyncServiceBus.
+    handle выполняется в отдельном потоке, чтобы не блокировать цикл событий
+    (обработчик сервиса в каждый момент один, очередь сервиса последовательна).
+    Сервис вызывает bus.publish как обычно; события накапливаются
+    и публикуются в асинхронную шину после завершения handle.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.pending = []
+        service.bus = self
+
+    def publish(self, event_name, data):
+        self.pending.append((event_name, data))
+
+    def _handle(self, data):
+        try:
+            result = self.service.handle(data)
+        except Exception:
+            get_store().rollback()
+            raise
+        get_store().commit()
+        return result
+
+    async def handle(self, data, bus):
+        result = await asyncio.to_thread(self._handle, data)
+        pending, self.pending = self.pending, []
+        for event_name, event_data in pending:
+            await bus.publish(event_name, event_data)
+        return result
+
+
+class AsyncServiceBus:
+    """
+    Асинхронная шина: у каждого сервиса своя очередь и обработчик.
+    publish/send возвращаются сразу после постановки события в очередь.
+    Обратное давление действует только на внешние команды (send/request):
+    у сервиса queue_size мест, при занятых местах отправитель ждет.
+    События, порожденные обработчиками, ставятся в очередь без ожидания -
+    подписки образуют цикл (заказ -> склад -> оплата -> доставка -> склад),
+    и обработчик, ждущий места в чужой очереди, мог бы ждать вечно.
+    - services: словарь зарегистрированных сервисов {name: service_instance}
+    - subscribers: словарь подписок на события {event_name: [service_name1, service_name2]}
+    - followers: подписки с after {(event_name, after): [service_name]} - событие ставится
+      в очередь сервиса только после успешной обработки сервисом after
+    - queues: очереди сервисов {name: asyncio.Queue}
+    - slots: места для внешних команд в очередях сервисов {name: asyncio.Semaphore}
+    - pending: количество событий в очередях и в обработке
+    """
+
+    def __init__(self, queue_size=100):
+        self.services = {}
+        self.subscribers = {}
+        self.followers = {}
+        self.queue_size = queue_size
+        self.queues = {}
+        self.slots = {}
+        self.workers = []
+        self.pending = 0
+        self.idle = None
+
+    def register_service(self, name, service):
+        """
+        Регистрирует сервис. Сервисы с синхронным handle оборачиваются в SyncHandlerAdapter.
+        """
+        if asyncio.iscoroutinefunction(service.handle):
+            service.bus = self
+        else:
+            service = SyncHandlerAdapter(service)
+        self.services[name] = service
+
+    def subscribe(self, event_name, service_name, after=None):
+        """
+        Подписывает сервис на событие.
+        after - сервис, который должен обработать событие раньше (например,
+        оплата только после резервирования товаров заказа).
+        """
+        if after is not None:
+            self.followers.setdefault((event_name, after), []).append(service_name)
+            return
+        if event_name not in self.subscribers:
+            self.subscribers[event_name] = []
+        self.subscribers[event_name].append(service_name)
+
+    async def start(self):
+        """Создает очереди и запускает обработчики сервисов."""
+        self.idle = asyncio.Event()
+        self.idle.set()
+        for name in self.services:
+            self.queues[name] = asyncio.Queue()
+            self.slots[name] = asyncio.Semaphore(self.queue_size)
+            self.workers.append(asyncio.create_task(self._worker(name)))
+
+    async def _worker(self, name):
+        service = self.services[name]
+        queue = self.queues[name]
+        while True:
+            data, future, external = await queue.get()
+            try:
+                if isinstance(service, SyncHandlerAdapter):
+                    result = await service.handle(data, self)
+                else:
+                    result = await service.handle(data)
+                    get_store().commit()
+                if future is not None:
+                    future.set_result(result)
+                for follower in self.followers.get((data.get("_event_type"), name), ()):
+                    self._enqueue(follower, data)
+            except Exception as e:
+                print(f"[AsyncServiceBus] Ошибка в сервисе '{name}': {e}")
+                if future is not None:
+                    future.set_exception(e)
+            finally:
+                queue.task_done()
+                if external:
+                    self.slots[name].release()
+                self.pending -= 1
+                if self.pending == 0:
+                    self.idle.set()
+
+    async def publish(self, event_name, data):
+        """
+        Публикует событие: ставит его в очереди всех подписанных сервисов (без ожидания мест).
+        """
+        payload = data.copy()
+        payload['_event_type'] = event_name
+
+        print(f"\n[AsyncServiceBus] Событие '{event_name}' опубликовано с данными: {data}")
+        for service_name in self.subscribers.get(event_name, []):
+            self._enqueue(service_name, payload)
+
+    async def send(self, target_service, data, future=None):
+        """
+        Ставит данные в очередь конкретного сервиса.
+        Если все места сервиса заняты, ждет, пока обработчик не освободит место.
+        """
+        if target_service not in self.queues:
+            print(f"[AsyncServiceBus] Ошибка: сервис '{target_service}' не найден.")
+            if future is not None:
+                future.set_result(None)
+            return
+        await self.slots[target_service].acquire()
+        self._enqueue(target_service, data, future, external=True)
+
+    def _enqueue(self, target_service, data, future=None, external=False):
+        """Ставит данные в очередь сервиса без ожидания."""
+        if target_service not in self.queues:
+            print(f"[AsyncServiceBus] Ошибка: сервис '{target_service}' не найден.")
+            return
+        self.pending += 1
+        self.idle.clear()
+        self.queues[target_service].put_nowait((data, future, external))
+
+    async def request(self, target_service, data):
+        """Ставит команду в очередь сервиса и ждет результата обработчика."""
+        future = asyncio.get_running_loop().create_future()
+        await self.send(target_service, data, future)
+        return await future
+
+    async def join(self):
+        """Ждет, пока все очереди (включая порожденные события) не опустеют."""
+        await self.idle.wait()
+
+    async def stop(self):
+        """Дожидается обработки событий и останавливает обработчики."""
+        await self.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+
+class AsyncBusRunner:
+    """
+    Запускает AsyncServiceBus в отдельном потоке с циклом событий и дает
+    синхронный интерфейс ServiceBus (send, request, wait, shutdown)
+    для консольного меню и HTTP API. send возвращается после постановки
+    в очередь, request - после обработки команды сервисом (цепочка событий
+    продолжается в фоне).
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self._call(bus.start())
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def send(self, target_service, data):
+        self._call(self.bus.send(target_service, data))
+
+    def request(self, target_service, data):
+        return self._call(self.bus.request(target_service, data))
+
+    def wait(self):
+        self._call(self.bus.join())
+
+    def shutdown(self):
+        """Дожидается обработки событий и останавливает цикл событий."""
+        self._call(self.bus.stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
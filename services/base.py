@@ -0,0 +1,129 @@
+import collections
+import functools
+import threading
+import time
+from storage import get_store
+
+
+class Service:
+    """
+    Базовый класс сервиса.
+    - ACTIONS: команды, принимаемые через send {action: имя метода}
+    - EVENTS: события, на которые реагирует сервис {event_name: имя метода}
+    По этим таблицам шина строит маршруты при регистрации и подписке,
+    handle использует их же при прямом вызове.
+    """
+
+    ACTIONS = {}
+    EVENTS = {}
+
+    def __init__(self):
+        self.bus = None
+
+    def handle(self, data):
+        method = self.ACTIONS.get(data.get("action")) or self.EVENTS.get(data.get("_event_type"))
+        if method:
+            return getattr(self, method)(data)
+
+
+class IdempotencyCache:
+    """
+    Результаты обработчиков по ключу идемпотентности: повтор с тем же ключом
+    возвращает сохраненный результат без повторного выполнения (и без повторных событий).
+    Записи хранятся в таблице idempotency хранилища и фиксируются вместе
+    с изменениями самой команды, поэтому переживают перезапуск.
+    - keys: записи в порядке последнего использования {key: {"result", "expires"}} (LRU);
+      результат хранится и в памяти: в SQLite запись таблицы видна другим потокам
+      только после фиксации транзакции всей цепочки, а повтор не должен ее ждать
+    - inflight: ключи, которые сейчас выполняются {key: threading.Event};
+      одновременный повтор ждет завершения первого вызова
+    - max_entries: предел числа записей, при превышении вытесняется самая давняя
+    - ttl: время хранения результата, сек
+    """
+
+    TABLE = "idempotency"
+
+    def __init__(self, max_entries=10000, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.keys = None
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def _load(self, store):
+        """Загружает ключи из хранилища при первом обращении."""
+        if self.keys is None:
+            entries = sorted(store.all(self.TABLE).items(), key=lambda entry: entry[1]["expires"])
+            self.keys = collections.OrderedDict(entries)
+
+    def _lookup(self, store, key):
+        """Возвращает сохраненную запись или None (с удалением истекшей)."""
+        entry = self.keys.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] < time.time():
+            del self.keys[key]
+            store.delete(self.TABLE, key)
+            return None
+        self.keys.move_to_end(key)
+        return entry
+
+    def _save(self, store, key, result):
+        entry = {"result": result, "expires": time.time() + self.ttl}
+        store.put(self.TABLE, key, entry)
+        self.keys[key] = dict(entry)
+        self.keys.move_to_end(key)
+        while len(self.keys) > self.max_entries:
+            oldest, _ = self.keys.popitem(last=False)
+            store.delete(self.TABLE, oldest)
+
+    def run(self, key, fn):
+        """Выполняет fn один раз для ключа, повторные вызовы получают тот же результат."""
+        store = get_store()
+        while True:
+            with self.lock:
+                self._load(store)
+                entry = self._lookup(store, key)
+                if entry is not None:
+                    return entry["result"]
+                event = self.inflight.get(key)
+                if event is None:
+                    self.inflight[key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            result = fn()
+            with self.lock:
+                self._save(store, key, result)
+            return result
+        finally:
+            with self.lock:
+                self.inflight.pop(key).set()
+
+
+_idempotency = None
+
+def get_idempotency():
+    """Возвращает общий кэш результатов по ключам идемпотентности."""
+    global _idempotency
+    if _idempotency is None:
+        _idempotency = IdempotencyCache()
+    return _idempotency
+
+
+def idempotent():
+    """
+    Декоратор обработчика сервиса: повтор команды с тем же idempotency_key
+    возвращает сохраненный результат. Без ключа обработчик выполняется как обычно.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, data):
+            key = data.get("idempotency_key")
+            if key is None:
+                return method(self, data)
+            # Ключ действует в пределах обработчика и пользователя
+            scope = f"{method.__name__}:{data.get('username')}:{key}"
+            return get_idempotency().run(scope, lambda: method(self, data))
+        return wrapper
+    return decorate
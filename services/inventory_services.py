@@ -1,45 +1,64 @@
-from utils import log_action, load_json, save_json
+from utils import log_action
+from services.base import Service
+from storage import get_store
+from services.user_services import get_sessions
+from stock import NAME_BYTES, get_stock
 
-INVENTORY_FILE = "data/inventory.json"
-USERS_FILE = "data/users.json"
-
-class InventoryService:
-    """Управление складом"""
+class InventoryService(Service):
+    """
+    Управление складом
+    Резервы товара хранятся в журнале reserved {order_id: количество};
+    quantity - доступный остаток, reserved_total - сумма активных резервов.
+    Резерв закрывается при отправке заказа в доставку или при его отмене.
+    Резерв и возврат одного товара выполняются как compare-and-swap по версии записи
+    (с повтором при конфликте); операции над несколькими товарами - под блокировкой таблицы.
+    Если включен движок остатков (get_stock), остатки и резервы ведутся в нем,
+    а JSON хранилище содержит только описание товаров.
+    """
+    
+    ACTIONS = {
+        "check_item": "_check_item",
+        "reserve_item": "_reserve_item",
+        "release_item": "_release_item"
+    }
+    EVENTS = {
+        "order_created": "_reserve_items_for_order",
+        "delivery_scheduled": "_close_reservations",
+        "order_cancelled": "_release_order"
+    }
     
-    def __init__(self):
-        self.bus = None
+    def _add_reservation(self, item, order_id, quantity):
+        """Списывает остаток и добавляет резерв заказа."""
+        item["quantity"] -= quantity
+        ledger = item.setdefault("reserved", {})
+        ledger[order_id] = ledger.get(order_id, 0) + quantity
+        item["reserved_total"] = item.get("reserved_total", 0) + quantity
     
-    def handle(self, data):
-        action = data.get("action")
-        event_type = data.get("_event_type")
-        
-        if action == "check_item":
-            return self._check_item(data)
-        elif action == "reserve_item":
-            return self._reserve_item(data)
-        elif action == "release_item":
-            return self._release_item(data)
-        elif event_type == "order_created":
-            self._reserve_items_for_order(data)
+    def _remove_reservation(self, item, order_id):
+        """Удаляет резерв заказа, возвращает его количество."""
+        quantity = item.get("reserved", {}).pop(order_id, 0)
+        item["reserved_total"] = item.get("reserved_total", 0) - quantity
+        return quantity
     
     def _check_item(self, data):
         """Проверяет наличие товара на складе."""
         item_name = data.get("item_name")
         quantity = data.get("quantity", 1)
         
-        inventory = load_json(INVENTORY_FILE)
+        stock = get_stock()
+        item = stock.get(item_name) if stock is not None else get_store().get("inventory", item_name)
         
-        if item_name not in inventory:
-            log_action("ПРОВЕРКА СКЛАДА", details=f"Товар '{item_name}' не найден")
+        if item is None:
+            log_action("ПРОВЕРКА СКЛАДА", details=f"Товар '{item_name}' не найден", item=item_name)
             return False
         
-        available = inventory[item_name].get("quantity", 0)
+        available = item.get("quantity", 0)
         
         if available < quantity:
-            log_action("ПРОВЕРКА СКЛАДА", details=f"Недостаточно '{item_name}': есть {available}, нужно {quantity}")
+            log_action("ПРОВЕРКА СКЛАДА", details=f"Недостаточно '{item_name}': есть {available}, нужно {quantity}", item=item_name)
             return False
         
-        log_action("ПРОВЕРКА СКЛАДА", details=f"Товар '{item_name}' доступен: {available} шт.")
+        log_action("ПРОВЕРКА СКЛАДА", details=f"Товар '{item_name}' доступен: {available} шт.", item=item_name)
         return True
     
     def _reserve_item(self, data):
@@ -48,23 +67,21 @@ class InventoryService:
         quantity = data.get("quantity", 1)
         order_id = data.get("order_id")
         
-        inventory = load_json(INVENTORY_FILE)
-        
-        if item_name not in inventory or inventory[item_name]["quantity"] < quantity:
+        def reserve(item):
+            if item["quantity"] < quantity:
+                return None
+            self._add_reservation(item, order_id, quantity)
+            return item
+        
+        stock = get_stock()
+        if stock is not None:
+            reserved = stock.reserve(item_name, quantity, order_id)
+        else:
+            reserved = get_store().update("inventory", item_name, reserve) is not None
+        if not reserved:
             return False
         
-        inventory[item_name]["quantity"] -= quantity
-        
-        if "reserved" not in inventory[item_name]:
-            inventory[item_name]["reserved"] = []
-        
-        inventory[item_name]["reserved"].append({
-            "order_id": order_id,
-            "quantity": quantity
-        })
-        
-        save_json(INVENTORY_FILE, inventory)
-        log_action("РЕЗЕРВИРОВАНИЕ", details=f"Заказ {order_id}: {item_name} x{quantity}")
+        log_action("РЕЗЕРВИРОВАНИЕ", details=f"Заказ {order_id}: {item_name} x{quantity}", order_id=order_id, item=item_name)
         
         if self.bus:
             self.bus.publish("item_reserved", {
@@ -78,69 +95,160 @@ class InventoryService:
         return True
     
     def _reserve_items_for_order(self, data):
-        """Резервирует все товары для заказа."""
+        """
+        Резервирует все товары для заказа по принципу "все или ничего":
+        все позиции проверяются и списываются под одной блокировкой,
+        при нехватке хотя бы одной заказ отклоняется целиком.
+        """
         order_id = data.get("order_id")
         items = data.get("items", [])
         username = data.get("username")
         
-        log_action("НАЧАЛО РЕЗЕРВИРОВАНИЯ", user=username, details=f"Заказ {order_id}, товаров: {len(items)}")
-        
-        all_reserved = True
+        log_action("НАЧАЛО РЕЗЕРВИРОВАНИЯ", user=username, details=f"Заказ {order_id}, товаров: {len(items)}", order_id=order_id)
         
+        # Суммируем количество по товарам (позиции могут повторяться)
+        needed = {}
         for item in items:
-            success = self._reserve_item({
-                "item_name": item["item_name"],
-                "quantity": item["quantity"],
-                "order_id": order_id,
-                "username": username
-            })
-            
-            if not success:
-                all_reserved = False
-                break
-        
-        if all_reserved:
-            log_action("РЕЗЕРВИРОВАНИЕ ЗАВЕРШЕНО", user=username, details=f"Заказ {order_id}")
+            needed[item["item_name"]] = needed.get(item["item_name"], 0) + item["quantity"]
+        
+        store = get_store()
+        stock = get_stock()
+        if stock is not None:
+            missing = stock.reserve_all(needed, order_id)
+        else:
+            with store.locked("inventory"):
+                missing = []
+                for item_name, quantity in needed.items():
+                    details = store.get("inventory", item_name)
+                    if details is None or details["quantity"] < quantity:
+                        missing.append(item_name)
+                
+                if not missing:
+                    for item_name, quantity in needed.items():
+                        details = store.get("inventory", item_name)
+                        self._add_reservation(details, order_id, quantity)
+                        store.put("inventory", item_name, details)
+        
+        if missing:
+            store.update("orders", order_id, lambda order: dict(order, status="rejected"))
+            log_action("ОШИБКА РЕЗЕРВИРОВАНИЯ", user=username,
+                       details=f"Заказ {order_id} отклонен, недостаточно: {', '.join(missing)}", order_id=order_id)
             if self.bus:
-                self.bus.publish("all_items_reserved", {
+                self.bus.publish("reservation_failed", {
                     "order_id": order_id,
-                    "username": username
+                    "username": username,
+                    "missing": missing,
+                    "message": f"Заказ {order_id} отклонен: недостаточно товара ({', '.join(missing)})"
                 })
+            return False
+        
+        log_action("РЕЗЕРВИРОВАНИЕ ЗАВЕРШЕНО", user=username,
+                   details=f"Заказ {order_id}: " + ", ".join(f"{name} x{qty}" for name, qty in needed.items()), order_id=order_id)
+        if self.bus:
+            self.bus.publish("all_items_reserved", {
+                "order_id": order_id,
+                "username": username,
+                "items": [{"item_name": name, "quantity": qty} for name, qty in needed.items()],
+                "message": f"Зарезервировано товаров: {len(needed)}"
+            })
+        return True
     
     def _release_item(self, data):
-        """Освобождает зарезервированный товар."""
+        """
+        Освобождает зарезервированный товар.
+        Если указан order_id, возвращается весь резерв этого заказа.
+        """
         item_name = data.get("item_name")
         quantity = data.get("quantity", 1)
+        order_id = data.get("order_id")
         
-        inventory = load_json(INVENTORY_FILE)
+        stock = get_stock()
+        if stock is not None:
+            if stock.get(item_name) is not None:
+                quantity = stock.release(item_name, quantity, order_id)
+                log_action("ОСВОБОЖДЕНИЕ ТОВАРА", details=f"{item_name} x{quantity}", order_id=order_id, item=item_name)
+            return
+        
+        released = {"quantity": quantity}
         
-        if item_name in inventory:
-            inventory[item_name]["quantity"] += quantity
-            save_json(INVENTORY_FILE, inventory)
-            log_action("ОСВОБОЖДЕНИЕ ТОВАРА", details=f"{item_name} x{quantity}")
+        def release(item):
+            if order_id is not None:
+                released["quantity"] = self._remove_reservation(item, order_id)
+            item["quantity"] += released["quantity"]
+            return item
+        
+        if get_store().update("inventory", item_name, release) is not None:
+            log_action("ОСВОБОЖДЕНИЕ ТОВАРА", details=f"{item_name} x{released['quantity']}", order_id=order_id, item=item_name)
+    
+    def _order_items(self, store, order_id):
+        order = store.get("orders", order_id)
+        if order is None:
+            return set()
+        return {item["item_name"] for item in order["items"]}
+    
+    def _close_reservations(self, data):
+        """Закрывает резервы заказа после отправки в доставку (товар покинул склад)."""
+        order_id = data.get("order_id")
+        
+        stock = get_stock()
+        if stock is not None:
+            for item_name in stock.order_items(order_id):
+                stock.release(item_name, order_id=order_id, restock=False)
+        else:
+            store = get_store()
+            with store.locked("inventory"):
+                for item_name in self._order_items(store, order_id):
+                    item = store.get("inventory", item_name)
+                    if item is not None and order_id in item.get("reserved", {}):
+                        self._remove_reservation(item, order_id)
+                        store.put("inventory", item_name, item)
+        
+        log_action("ЗАКРЫТИЕ РЕЗЕРВА", user=data.get("username"), details=f"Заказ {order_id}", order_id=order_id)
+    
+    def _release_order(self, data):
+        """Возвращает на склад все резервы отмененного заказа."""
+        order_id = data.get("order_id")
+        
+        stock = get_stock()
+        if stock is not None:
+            for item_name in stock.order_items(order_id):
+                stock.release(item_name, order_id=order_id)
+        else:
+            store = get_store()
+            with store.locked("inventory"):
+                for item_name in self._order_items(store, order_id):
+                    item = store.get("inventory", item_name)
+                    if item is not None and order_id in item.get("reserved", {}):
+                        item["quantity"] += self._remove_reservation(item, order_id)
+                        store.put("inventory", item_name, item)
+        
+        log_action("ОСВОБОЖДЕНИЕ РЕЗЕРВА", user=data.get("username"), details=f"Заказ {order_id}", order_id=order_id)
 
 
-class PurchaseService:
+class PurchaseService(Service):
     """Пополнение и управление складом (только для admin)"""
     
-    def __init__(self):
-        self.bus = None
-    
-    def handle(self, data):
-        action = data.get("action")
-        
-        if action == "add_item":
-            self._add_item(data)
-        elif action == "update_item":
-            self._update_item(data)
-        elif action == "remove_item":
-            self._remove_item(data)
+    ACTIONS = {
+        "add_item": "_add_item",
+        "update_item": "_update_item",
+        "remove_item": "_remove_item"
+    }
     
-    def _check_admin(self, username):
-        """Проверяет права администратора."""
-        users = load_json(USERS_FILE)
-        
-        if username not in users or users[username].get("role") != "admin":
+    def _check_admin(self, data):
+        """
+        Проверяет права администратора.
+        Роль берется из сессии по токену; без токена - из хранилища пользователей.
+        """
+        username = data.get("username")
+        token = data.get("token")
+        if token is not None:
+            session = get_sessions().get(token)
+            role = session["role"] if session is not None and session["username"] == username else None
+        else:
+            user = get_store().get("users", username)
+            role = user.get("role") if user is not None else None
+        
+        if role != "admin":
             log_action("ОТКАЗ В ДОСТУПЕ", user=username, details="Требуются права admin")
             return False
         
@@ -153,8 +261,8 @@ class PurchaseService:
         quantity = data.get("quantity", 0)
         price = data.get("price", 0)
         
-        if not self._check_admin(username):
-            return
+        if not self._check_admin(data):
+            return False
         
         # Простая валидация
         try:
@@ -162,25 +270,34 @@ class PurchaseService:
             price = float(price)
             if quantity <= 0 or price <= 0:
                 log_action("ОШИБКА ВАЛИДАЦИИ", user=username, details="Количество и цена должны быть положительными")
-                return
+                return False
         except (ValueError, TypeError):
             log_action("ОШИБКА ВАЛИДАЦИИ", user=username, details="Некорректные числовые значения")
-            return
-        
-        inventory = load_json(INVENTORY_FILE)
+            return False
         
-        if item_name in inventory:
-            log_action("ОШИБКА ДОБАВЛЕНИЯ", user=username, details=f"Товар '{item_name}' уже существует")
-            return
+        # Название должно поместиться в запись движка остатков, иначе товар нельзя заказать
+        if get_stock() is not None and not get_stock().fits(item_name):
+            log_action("ОШИБКА ВАЛИДАЦИИ", user=username,
+                       details=f"Название товара длиннее {NAME_BYTES} байт", item=item_name)
+            return False
         
-        inventory[item_name] = {
-            "quantity": quantity,
-            "price": price,
-            "reserved": []
-        }
+        store = get_store()
+        with store.locked("inventory"):
+            exists = store.get("inventory", item_name) is not None
+            if not exists:
+                store.put("inventory", item_name, {
+                    "quantity": quantity,
+                    "price": price,
+                    "reserved": {},
+                    "reserved_total": 0
+                })
         
-        save_json(INVENTORY_FILE, inventory)
-        log_action("ДОБАВЛЕНИЕ ТОВАРА", user=username, details=f"{item_name}: {quantity} шт. по {price} руб.")
+        if exists:
+            log_action("ОШИБКА ДОБАВЛЕНИЯ", user=username, details=f"Товар '{item_name}' уже существует", item=item_name)
+            return False
+        if get_stock() is not None:
+            get_stock().put(item_name, quantity, price)
+        log_action("ДОБАВЛЕНИЕ ТОВАРА", user=username, details=f"{item_name}: {quantity} шт. по {price} руб.", item=item_name)
         
         if self.bus:
             self.bus.publish("item_added", {
@@ -190,6 +307,7 @@ class PurchaseService:
                 "price": price,
                 "message": f"На склад добавлен товар: {item_name} ({quantity} шт.)"
             })
+        return True
     
     def _update_item(self, data):
         """Обновляет количество товара на складе."""
@@ -198,34 +316,44 @@ class PurchaseService:
         quantity = data.get("quantity")
         price = data.get("price")
         
-        if not self._check_admin(username):
-            return
+        if not self._check_admin(data):
+            return False
         
-        inventory = load_json(INVENTORY_FILE)
+        store = get_store()
+        item = store.get("inventory", item_name)
         
-        if item_name not in inventory:
-            log_action("ОШИБКА ОБНОВЛЕНИЯ", user=username, details=f"Товар '{item_name}' не найден")
-            return
+        if item is None:
+            log_action("ОШИБКА ОБНОВЛЕНИЯ", user=username, details=f"Товар '{item_name}' не найден", item=item_name)
+            return False
         
-        # Простая валидация и обновление
+        # Простая валидация (до изменения записи в хранилище)
         try:
             if quantity is not None:
                 quantity = int(quantity)
                 if quantity <= 0:
                     raise ValueError
-                inventory[item_name]["quantity"] = quantity
             
             if price is not None:
                 price = float(price)
                 if price <= 0:
                     raise ValueError
-                inventory[item_name]["price"] = price
         except (ValueError, TypeError):
             log_action("ОШИБКА ВАЛИДАЦИИ", user=username, details="Некорректные значения")
-            return
+            return False
         
-        save_json(INVENTORY_FILE, inventory)
-        log_action("ОБНОВЛЕНИЕ ТОВАРА", user=username, details=f"{item_name}")
+        def change(item):
+            if quantity is not None:
+                item["quantity"] = quantity
+            if price is not None:
+                item["price"] = price
+            return item
+        
+        if store.update("inventory", item_name, change) is None:
+            log_action("ОШИБКА ОБНОВЛЕНИЯ", user=username, details=f"Товар '{item_name}' не найден", item=item_name)
+            return False
+        if get_stock() is not None:
+            get_stock().put(item_name, quantity, price)
+        log_action("ОБНОВЛЕНИЕ ТОВАРА", user=username, details=f"{item_name}", item=item_name)
         
         if self.bus:
             self.bus.publish("item_updated", {
@@ -233,28 +361,33 @@ class PurchaseService:
                 "item_name": item_name,
                 "message": f"Товар '{item_name}' обновлен"
             })
+        return True
     
     def _remove_item(self, data):
         """Удаляет товар со склада."""
         username = data.get("username")
         item_name = data.get("item_name")
         
-        if not self._check_admin(username):
-            return
+        if not self._check_admin(data):
+            return False
         
-        inventory = load_json(INVENTORY_FILE)
+        store = get_store()
+        with store.locked("inventory"):
+            exists = store.get("inventory", item_name) is not None
+            if exists:
+                store.delete("inventory", item_name)
         
-        if item_name not in inventory:
-            log_action("ОШИБКА УДАЛЕНИЯ", user=username, details=f"Товар '{item_name}' не найден")
-            return
-        
-        del inventory[item_name]
-        save_json(INVENTORY_FILE, inventory)
-        log_action("УДАЛЕНИЕ ТОВАРА", user=username, details=f"{item_name}")
+        if not exists:
+            log_action("ОШИБКА УДАЛЕНИЯ", user=username, details=f"Товар '{item_name}' не найден", item=item_name)
+            return False
+        if get_stock() is not None:
+            get_stock().remove(item_name)
+        log_action("УДАЛЕНИЕ ТОВАРА", user=username, details=f"{item_name}", item=item_name)
         
         if self.bus:
             self.bus.publish("item_removed", {
                 "username": username,
                 "item_name": item_name,
                 "message": f"Товар '{item_name}' удален"
-            })
\ No newline at end of file
+            })
+        return True
\ No newline at end of file
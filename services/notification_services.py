@@ -1,26 +1,275 @@
 from utils import log_action
+from services.base import Service
+from storage import get_store
+from email.message import EmailMessage
+import queue
+import smtplib
+import threading
+import time
 
-class NotificationService:
-    """Отправка уведомлений пользователям"""
+
+def format_digest(digest):
+    """Формирует текст дайджеста уведомлений."""
+    lines = [f"УВЕДОМЛЕНИЕ для {digest['username']}"]
+    if digest["order_id"]:
+        lines.append(f"Заказ: {digest['order_id']}")
+    for notification in digest["notifications"]:
+        lines.append(f"{notification['emoji']} {notification['event_type']}: {notification['message']}")
+    return "\n".join(lines)
+
+
+class UndeliveredError(Exception):
+    """
+    Ошибка доставки части пачки: undelivered - дайджесты, которые не были отправлены
+    (повтор не должен отправлять уже доставленные).
+    """
+
+    def __init__(self, error, undelivered):
+        super().__init__(str(error))
+        self.undelivered = undelivered
+
+
+class StdoutSink:
+    """Вывод дайджестов в консоль."""
+    
+    name = "stdout"
+    
+    def deliver(self, digests):
+        for digest in digests:
+            print(f"\n{'='*60}\n{format_digest(digest)}\n{'='*60}\n")
+
+
+class FileSink:
+    """Запись дайджестов в файл одной операцией на пачку."""
+    
+    name = "file"
+    
+    def __init__(self, path="notifications.txt"):
+        self.path = path
+    
+    def deliver(self, digests):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(format_digest(digest) + "\n\n" for digest in digests))
+
+
+class SmtpSink:
+    """
+    Отправка дайджестов письмами на email пользователя из хранилища.
+    По умолчанию - локальный тестовый SMTP сервер (localhost:1025);
+    вся пачка отправляется в рамках одного соединения. Письма отправляются по одному:
+    при ошибке UndeliveredError содержит только неотправленные дайджесты.
+    """
+    
+    name = "smtp"
+    
+    def __init__(self, host="localhost", port=1025, sender="noreply@lb4.local"):
+        self.host = host
+        self.port = port
+        self.sender = sender
+    
+    def _message(self, digest):
+        user = get_store().get("users", digest["username"])
+        email = user.get("email") if user else None
+        if not email or email == "-@-.-":
+            return None
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = email
+        message["Subject"] = f"Уведомление для {digest['username']}"
+        message.set_content(format_digest(digest))
+        return message
+    
+    def deliver(self, digests):
+        pending = [(digest, message) for digest, message in ((d, self._message(d)) for d in digests)
+                   if message is not None]
+        if not pending:
+            return
+        sent = 0
+        try:
+            with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+                for digest, message in pending:
+                    smtp.send_message(message)
+                    sent += 1
+        except Exception as e:
+            # Ошибка при закрытии соединения после отправки всех писем - пачка доставлена
+            if sent < len(pending):
+                raise UndeliveredError(e, [digest for digest, _ in pending[sent:]]) from e
+
+
+class NotificationDispatcher:
+    """
+    Асинхронная доставка: пачки дайджестов ставятся в очередь и отправляются
+    пулом потоков, поэтому медленные каналы (SMTP) не задерживают цепочку событий.
+    Используется как sink для NotificationOutbox.
+    - channels: каналы доставки (sinks)
+    - limits: максимум одновременных доставок по каналу {name: n}
+    - retries, backoff: число повторов при ошибке и начальная пауза (удваивается);
+      при UndeliveredError повторяется только недоставленный остаток пачки
+    """
+    
+    def __init__(self, channels, workers=4, limits=None, retries=3, backoff=0.5):
+        self.channels = channels
+        self.retries = retries
+        self.backoff = backoff
+        limits = limits or {}
+        self.semaphores = {channel.name: threading.Semaphore(limits.get(channel.name, workers))
+                           for channel in channels}
+        self.queue = queue.Queue()
+        self.pending = 0
+        self.idle = threading.Condition()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+    
+    def deliver(self, digests):
+        """Ставит пачку в очередь каждого канала и сразу возвращается."""
+        for channel in self.channels:
+            self._put(channel, digests, 0)
+    
+    def _put(self, channel, digests, attempt):
+        with self.idle:
+            self.pending += 1
+        self.queue.put((channel, digests, attempt))
+    
+    def _done(self):
+        with self.idle:
+            self.pending -= 1
+            if self.pending == 0:
+                self.idle.notify_all()
+    
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            channel, digests, attempt = task
+            try:
+                with self.semaphores[channel.name]:
+                    channel.deliver(digests)
+            except Exception as e:
+                digests = getattr(e, "undelivered", digests)
+                if attempt < self.retries:
+                    delay = self.backoff * 2 ** attempt
+                    print(f"[NotificationDispatcher] Ошибка канала {channel.name}: {e}, повтор через {delay} с")
+                    # Повтор ставится в очередь таймером, поток доставки не простаивает;
+                    # учитывается в pending сразу, чтобы close дождался его
+                    with self.idle:
+                        self.pending += 1
+                    timer = threading.Timer(delay, self.queue.put, ((channel, digests, attempt + 1),))
+                    timer.daemon = True
+                    timer.start()
+                else:
+                    log_action("ОШИБКА ДОСТАВКИ", details=f"Канал {channel.name}: {e}, дайджестов: {len(digests)}")
+            finally:
+                self._done()
+    
+    def close(self):
+        """Дожидается доставки (включая повторы) и останавливает потоки."""
+        with self.idle:
+            while self.pending:
+                self.idle.wait()
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+
+class NotificationOutbox:
+    """
+    Накопитель уведомлений: события одного пользователя по одному заказу,
+    пришедшие за окно window (сек), объединяются в один дайджест.
+    Готовые дайджесты доставляются пачкой во все sinks фоновым потоком;
+    при window=0 каждое уведомление доставляется сразу, без фонового потока.
+    - groups: {(username, order_id): {"created": время, "notifications": [...]}}
+    """
     
-    def __init__(self):
-        self.bus = None
+    def __init__(self, sinks, window=1.0):
+        self.sinks = sinks
+        self.window = window
+        self.groups = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        if window > 0:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
     
-    def handle(self, data):
-        event_type = data.get("_event_type")
+    def add(self, username, order_id, event_type, message, emoji):
+        with self.lock:
+            group = self.groups.setdefault((username, order_id), {
+                "created": time.monotonic(),
+                "notifications": []
+            })
+            group["notifications"].append({
+                "event_type": event_type,
+                "message": message,
+                "emoji": emoji
+            })
+        if self.thread is None:
+            self.flush(force=True)
+    
+    def _run(self):
+        while not self.stopped.wait(self.window / 2):
+            self.flush()
+    
+    def flush(self, force=False):
+        """Доставляет дайджесты, окно которых истекло (force - все)."""
+        now = time.monotonic()
+        with self.lock:
+            ready = [key for key, group in self.groups.items()
+                     if force or now - group["created"] >= self.window]
+            digests = [{
+                "username": username,
+                "order_id": order_id,
+                "notifications": self.groups.pop((username, order_id))["notifications"]
+            } for username, order_id in ready]
+        if not digests:
+            return
+        
+        for digest in digests:
+            event_types = ", ".join(n["event_type"] for n in digest["notifications"])
+            log_action("УВЕДОМЛЕНИЕ", user=digest["username"], details=f"Дайджест: {event_types}",
+                       order_id=digest["order_id"] or None)
         
-        # Реагируем на различные события
-        if event_type in [
-            "profile_created", 
-            "delivery_scheduled", 
-            "item_added", 
-            "item_reserved",
-            "item_updated",
-            "item_removed",
-            "payment_done",
-            "all_items_reserved"
-        ]:
-            self._send_notification(data)
+        for sink in self.sinks:
+            try:
+                sink.deliver(digests)
+            except Exception as e:
+                print(f"[NotificationOutbox] Ошибка доставки через {type(sink).__name__}: {e}")
+    
+    def close(self):
+        """Останавливает фоновый поток, доставляет накопленные уведомления и закрывает sinks."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush(force=True)
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+
+class NotificationService(Service):
+    """
+    Отправка уведомлений пользователям
+    Без outbox уведомление выводится сразу; с outbox - накапливается в дайджест.
+    """
+    
+    EVENTS = {event_type: "_send_notification" for event_type in (
+        "profile_created",
+        "delivery_scheduled",
+        "item_added",
+        "item_reserved",
+        "item_updated",
+        "item_removed",
+        "payment_done",
+        "all_items_reserved",
+        "reservation_failed",
+        "order_cancelled"
+    )}
+    
+    def __init__(self, outbox=None):
+        super().__init__()
+        self.outbox = outbox
     
     def _send_notification(self, data):
         """
@@ -35,8 +284,10 @@ class NotificationService:
         emoji = "📧"
         if event_type == "item_added":
             emoji = "📦"
-        elif event_type == "item_reserved":
+        elif event_type in ("item_reserved", "all_items_reserved"):
             emoji = "🔒"
+        elif event_type in ("reservation_failed", "order_cancelled"):
+            emoji = "❌"
         elif event_type == "payment_done":
             emoji = "💰"
         elif event_type == "delivery_scheduled":
@@ -44,7 +295,11 @@ class NotificationService:
         elif event_type == "profile_created":
             emoji = "👤"
         
-        log_action("УВЕДОМЛЕНИЕ", user=username, details=f"{event_type}: {message}")
+        if self.outbox:
+            self.outbox.add(username, order_id, event_type, message, emoji)
+            return
+        
+        log_action("УВЕДОМЛЕНИЕ", user=username, details=f"{event_type}: {message}", order_id=order_id or None)
         
         print(f"\n{'='*60}")
         print(f"{emoji} УВЕДОМЛЕНИЕ для {username}")
@@ -52,4 +307,4 @@ class NotificationService:
         if order_id:
             print(f"Заказ: {order_id}")
         print(f"Сообщение: {message}")
-        print(f"{'='*60}\n")
\ No newline at end of file
+        print(f"{'='*60}\n")
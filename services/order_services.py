@@ -1,21 +1,43 @@
-from utils import log_action, load_json, save_json
+from utils import log_action
+from services.base import Service, idempotent
+from storage import get_store
 import uuid
 
-ORDERS_FILE = "data/orders.json"
-INVENTORY_FILE = "data/inventory.json"
-
-class OrderService:
+class OrderService(Service):
     """Создание и управление заказами"""
     
-    def __init__(self):
-        self.bus = None
+    ACTIONS = {
+        "create_order": "_create_order",
+        "create_orders": "_create_orders",
+        "list_orders": "_list_orders",
+        "cancel_order": "_cancel_order"
+    }
     
-    def handle(self, data):
-        action = data.get("action")
-        
-        if action == "create_order":
-            self._create_order(data)
+    def _price_order(self, store, items):
+        """Вычисляет общую стоимость заказа по ценам из хранилища."""
+        total = 0
+        for item in items:
+            details = store.get("inventory", item["item_name"])
+            if details is not None:
+                total += details.get("price", 0) * item["quantity"]
+        return total
+    
+    def _valid_items(self, items):
+        """Проверяет позиции корзины: непустой список {item_name, quantity > 0}."""
+        return isinstance(items, list) and bool(items) and all(
+            isinstance(item, dict) and isinstance(item.get("item_name"), str)
+            and isinstance(item.get("quantity"), int) and item["quantity"] > 0 for item in items)
+    
+    def _publish_order_created(self, order_id, order):
+        if self.bus:
+            self.bus.publish("order_created", {
+                "order_id": order_id,
+                "username": order["username"],
+                "items": order["items"],
+                "total": order["total"]
+            })
     
+    @idempotent()
     def _create_order(self, data):
         """Создает новый заказ."""
         username = data.get("username")
@@ -28,60 +50,142 @@ class OrderService:
         order_id = str(uuid.uuid4())[:8]
         
         # Вычисляем общую стоимость
-        inventory = load_json(INVENTORY_FILE)
-        total = 0
-        for item in items:
-            if item["item_name"] in inventory:
-                price = inventory[item["item_name"]].get("price", 0)
-                total += price * item["quantity"]
+        store = get_store()
+        total = self._price_order(store, items)
         
         # Создаем заказ
-        orders = load_json(ORDERS_FILE)
-        orders[order_id] = {
+        order = {
             "username": username,
             "items": items,
             "status": "created",
             "total": total
         }
-        save_json(ORDERS_FILE, orders)
+        store.put("orders", order_id, order)
+        
+        log_action("СОЗДАНИЕ ЗАКАЗА", user=username, details=f"ID: {order_id}, Сумма: {total} руб.", order_id=order_id)
+        
+        self._publish_order_created(order_id, order)
+        return order_id
+    
+    @idempotent()
+    def _create_orders(self, data):
+        """
+        Создает пакет заказов: все корзины оцениваются под одной блокировкой хранилища
+        (единый снимок цен) и сохраняются одной записью, затем для каждого заказа публикуется order_created.
+        Некорректные корзины пропускаются; сохранение начинается только после проверки и оценки всех корзин.
+        """
+        carts = data.get("orders", [])
+        store = get_store()
+        created = {}
+        
+        with store.locked("orders"):
+            for cart in carts:
+                username = cart.get("username", data.get("username")) if isinstance(cart, dict) else data.get("username")
+                items = cart.get("items", []) if isinstance(cart, dict) else None
+                
+                if not self._valid_items(items):
+                    log_action("ОШИБКА СОЗДАНИЯ ЗАКАЗА", user=username,
+                               details="Список товаров пуст" if not items else "Некорректные позиции заказа")
+                    continue
+                
+                order_id = str(uuid.uuid4())[:8]
+                created[order_id] = {
+                    "username": username,
+                    "items": items,
+                    "status": "created",
+                    "total": self._price_order(store, items)
+                }
+            
+            for order_id, order in created.items():
+                store.put("orders", order_id, order)
+        
+        log_action("ПАКЕТНОЕ СОЗДАНИЕ ЗАКАЗОВ", user=data.get("username"),
+                   details=f"Создано заказов: {len(created)} из {len(carts)}")
+        
+        for order_id, order in created.items():
+            self._publish_order_created(order_id, order)
+        return list(created)
+
+    
+    def _list_orders(self, data):
+        """
+        Возвращает заказы пользователя и/или заказы в заданном статусе.
+        Ответ строится по вторичным индексам хранилища.
+        """
+        username = data.get("username")
+        status = data.get("status")
+        store = get_store()
+        
+        if username is not None:
+            order_ids = store.find("orders", "username", username)
+        elif status is not None:
+            order_ids = store.find("orders", "status", status)
+        else:
+            return {}
+        
+        orders = {}
+        for order_id in order_ids:
+            order = store.get("orders", order_id)
+            if order is not None and (status is None or order["status"] == status):
+                orders[order_id] = order
+        return orders
+    
+    def _cancel_order(self, data):
+        """Отменяет заказ, который еще не передан в доставку."""
+        order_id = data.get("order_id")
+        username = data.get("username")
+        
+        store = get_store()
+        with store.locked("orders"):
+            order = store.get("orders", order_id)
+            cancellable = (order is not None and order["username"] == username
+                           and order["status"] in ("created", "paid"))
+            if cancellable:
+                order["status"] = "cancelled"
+                store.put("orders", order_id, order)
         
-        log_action("СОЗДАНИЕ ЗАКАЗА", user=username, details=f"ID: {order_id}, Сумма: {total} руб.")
+        if not cancellable:
+            log_action("ОШИБКА ОТМЕНЫ ЗАКАЗА", user=username, details=f"Заказ {order_id} нельзя отменить", order_id=order_id)
+            return False
+        
+        log_action("ОТМЕНА ЗАКАЗА", user=username, details=f"Заказ {order_id}", order_id=order_id)
         
         if self.bus:
-            self.bus.publish("order_created", {
+            self.bus.publish("order_cancelled", {
                 "order_id": order_id,
                 "username": username,
-                "items": items,
-                "total": total
+                "message": f"Заказ {order_id} отменен"
             })
+        return True
 
 
-class PaymentService:
+class PaymentService(Service):
     """Обработка платежей"""
     
-    def __init__(self):
-        self.bus = None
-    
-    def handle(self, data):
-        event_type = data.get("_event_type")
-        action = data.get("action")
-        
-        if event_type == "order_created" or action == "process_payment":
-            self._process_payment(data)
+    ACTIONS = {"process_payment": "_process_payment"}
+    EVENTS = {"order_created": "_process_payment"}
     
+    @idempotent()
     def _process_payment(self, data):
         """Обрабатывает платеж для заказа."""
         order_id = data.get("order_id")
         username = data.get("username")
         total = data.get("total", 0)
         
-        log_action("ОБРАБОТКА ПЛАТЕЖА", user=username, details=f"Заказ {order_id}, Сумма: {total} руб.")
+        log_action("ОБРАБОТКА ПЛАТЕЖА", user=username, details=f"Заказ {order_id}, Сумма: {total} руб.", order_id=order_id)
         
         # Обновляем статус заказа
-        orders = load_json(ORDERS_FILE)
-        if order_id in orders:
-            orders[order_id]["status"] = "paid"
-            save_json(ORDERS_FILE, orders)
+        store = get_store()
+        with store.locked("orders"):
+            order = store.get("orders", order_id)
+            rejected = order is not None and order["status"] == "rejected"
+            if order is not None and not rejected:
+                order["status"] = "paid"
+                store.put("orders", order_id, order)
+        
+        if rejected:
+            log_action("ОТМЕНА ПЛАТЕЖА", user=username, details=f"Заказ {order_id} отклонен складом", order_id=order_id)
+            return
         
         if self.bus:
             self.bus.publish("payment_done", {
@@ -91,31 +195,27 @@ class PaymentService:
             })
 
 
-class DeliveryService:
+class DeliveryService(Service):
     """Организация доставки"""
     
-    def __init__(self):
-        self.bus = None
-    
-    def handle(self, data):
-        event_type = data.get("_event_type")
-        action = data.get("action")
-        
-        if event_type == "payment_done" or action == "schedule_delivery":
-            self._schedule_delivery(data)
+    ACTIONS = {"schedule_delivery": "_schedule_delivery"}
+    EVENTS = {"payment_done": "_schedule_delivery"}
     
+    @idempotent()
     def _schedule_delivery(self, data):
         """Планирует доставку заказа."""
         order_id = data.get("order_id")
         username = data.get("username")
         
-        log_action("ПЛАНИРОВАНИЕ ДОСТАВКИ", user=username, details=f"Заказ {order_id}")
+        log_action("ПЛАНИРОВАНИЕ ДОСТАВКИ", user=username, details=f"Заказ {order_id}", order_id=order_id)
         
         # Обновляем статус
-        orders = load_json(ORDERS_FILE)
-        if order_id in orders:
-            orders[order_id]["status"] = "in_delivery"
-            save_json(ORDERS_FILE, orders)
+        store = get_store()
+        with store.locked("orders"):
+            order = store.get("orders", order_id)
+            if order is not None:
+                order["status"] = "in_delivery"
+                store.put("orders", order_id, order)
         
         if self.bus:
             self.bus.publish("delivery_scheduled", {
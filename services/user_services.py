@@ -1,21 +1,96 @@
-from utils import log_action, load_json, save_json
+from utils import log_action
+from services.base import Service
+from storage import get_store
 from datetime import datetime
+import collections
+import threading
+import time
+import uuid
 
-USERS_FILE = "data/users.json"
 
-class AuthService:
-    """Регистрация и аутентификация пользователей"""
+class SessionStore:
+    """
+    Сессии пользователей в памяти: токен выдается при входе,
+    роль проверяется по токену без обращения к хранилищу.
+    - sessions: {token: {"username", "role", "expires"}} в порядке последнего использования (LRU)
+    - by_user: токены пользователя {username: set(tokens)} для инвалидации
+    - max_sessions: предел числа сессий, при превышении удаляется самая давняя
+    - ttl: время жизни сессии без обращений, сек
+    """
     
-    def __init__(self):
-        self.bus = None
+    def __init__(self, max_sessions=1000, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = collections.OrderedDict()
+        self.by_user = {}
+        self.lock = threading.Lock()
     
-    def handle(self, data):
-        action = data.get("action")
-        
-        if action == "register":
-            self._register_user(data)
-        elif action == "login":
-            self._login_user(data)
+    def create(self, username, role):
+        """Создает сессию и возвращает ее токен."""
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[token] = {
+                "username": username,
+                "role": role,
+                "expires": time.monotonic() + self.ttl
+            }
+            self.by_user.setdefault(username, set()).add(token)
+            while len(self.sessions) > self.max_sessions:
+                self._remove(next(iter(self.sessions)))
+        return token
+    
+    def get(self, token):
+        """Возвращает сессию по токену (None - нет или истекла) и продлевает ее."""
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            now = time.monotonic()
+            if session["expires"] < now:
+                self._remove(token)
+                return None
+            session["expires"] = now + self.ttl
+            self.sessions.move_to_end(token)
+            return session
+    
+    def _remove(self, token):
+        session = self.sessions.pop(token, None)
+        if session is not None:
+            tokens = self.by_user.get(session["username"], set())
+            tokens.discard(token)
+            if not tokens:
+                self.by_user.pop(session["username"], None)
+    
+    def remove(self, token):
+        """Завершает сессию (выход из системы)."""
+        with self.lock:
+            self._remove(token)
+    
+    def invalidate_user(self, username):
+        """Удаляет все сессии пользователя (данные пользователя изменились)."""
+        with self.lock:
+            for token in list(self.by_user.get(username, ())):
+                self._remove(token)
+
+
+_sessions = None
+
+def get_sessions():
+    """Возвращает общее хранилище сессий."""
+    global _sessions
+    if _sessions is None:
+        _sessions = SessionStore()
+    return _sessions
+
+
+class AuthService(Service):
+    """Регистрация и аутентификация пользователей"""
+    
+    ACTIONS = {
+        "register": "_register_user",
+        "login": "_login_user",
+        "logout": "_logout_user"
+    }
     
     def _register_user(self, data):
         """Регистрирует нового пользователя."""
@@ -23,67 +98,76 @@ class AuthService:
         password = data.get("password")
         role = data.get("role", "user")
         
-        users = load_json(USERS_FILE)
-        
-        if username in users:
-            log_action("ОШИБКА РЕГИСТРАЦИИ", details=f"Пользователь '{username}' уже существует")
-            return
-        
-        users[username] = {
+        store = get_store()
+        user = {
             "password": password,
             "role": role,
             "email": data.get("email", f"{username}@example.com"),
             "profile_created": False
         }
         
-        save_json(USERS_FILE, users)
+        with store.locked("users"):
+            exists = store.get("users", username) is not None
+            if not exists:
+                store.put("users", username, user)
+        
+        if exists:
+            log_action("ОШИБКА РЕГИСТРАЦИИ", details=f"Пользователь '{username}' уже существует")
+            return False
+        get_sessions().invalidate_user(username)
         log_action("РЕГИСТРАЦИЯ", user=username, details=f"Роль: {role}")
         
         if self.bus:
             self.bus.publish("user_registered", {
                 "username": username,
-                "email": users[username]["email"],
+                "email": user["email"],
                 "role": role
             })
+        return True
     
     def _login_user(self, data):
-        """Вход пользователя в систему."""
+        """
+        Вход пользователя в систему.
+        Возвращает сессию {"token", "username", "role", "email"} или None.
+        """
         username = data.get("username")
         password = data.get("password")
         
-        users = load_json(USERS_FILE)
+        user = get_store().get("users", username)
         
-        if username not in users:
+        if user is None:
             log_action("ОШИБКА ВХОДА", details=f"Пользователь '{username}' не найден")
             return None
         
-        if password != users[username]["password"]:
+        if password != user["password"]:
             log_action("ОШИБКА ВХОДА", user=username, details="Неверный пароль")
             return None
         
-        log_action("ВХОД В СИСТЕМУ", user=username, details=f"Роль: {users[username]['role']}")
+        log_action("ВХОД В СИСТЕМУ", user=username, details=f"Роль: {user['role']}")
         
         if self.bus:
             self.bus.publish("user_logged_in", {
                 "username": username,
-                "role": users[username]["role"]
+                "role": user["role"]
             })
         
-        return users[username]
+        return {
+            "token": get_sessions().create(username, user["role"]),
+            "username": username,
+            "role": user["role"],
+            "email": user.get("email")
+        }
+    
+    def _logout_user(self, data):
+        """Завершает сессию пользователя."""
+        get_sessions().remove(data.get("token"))
 
 
-class VerificationService:
+class VerificationService(Service):
     """Подтверждение почты и проверка данных"""
     
-    def __init__(self):
-        self.bus = None
-    
-    def handle(self, data):
-        action = data.get("action")
-        event_type = data.get("_event_type")
-        
-        if action == "verify_email" or event_type == "user_registered":
-            self._verify_email(data)
+    ACTIONS = {"verify_email": "_verify_email"}
+    EVENTS = {"user_registered": "_verify_email"}
     
     def _verify_email(self, data):
         """Симулирует проверку email."""
@@ -100,32 +184,29 @@ class VerificationService:
             })
 
 
-class ProfileService:
+class ProfileService(Service):
     """Создание и обновление профиля пользователя"""
     
-    def __init__(self):
-        self.bus = None
-    
-    def handle(self, data):
-        action = data.get("action")
-        event_type = data.get("_event_type")
-        
-        if action == "create_profile" or event_type == "email_verified":
-            self._create_profile(data)
-        elif action == "update_profile":
-            self._update_profile(data)
+    ACTIONS = {
+        "create_profile": "_create_profile",
+        "update_profile": "_update_profile"
+    }
+    EVENTS = {"email_verified": "_create_profile"}
     
     def _create_profile(self, data):
         """Создает профиль пользователя после верификации."""
         username = data.get("username")
         
-        users = load_json(USERS_FILE)
+        store = get_store()
+        with store.locked("users"):
+            user = store.get("users", username)
+            created = user is not None and not user.get("profile_created")
+            if created:
+                user["profile_created"] = True
+                user["created_at"] = str(datetime.now())
+                store.put("users", username, user)
         
-        if username in users and not users[username].get("profile_created"):
-            users[username]["profile_created"] = True
-            users[username]["created_at"] = str(datetime.now())
-            save_json(USERS_FILE, users)
-            
+        if created:
             log_action("СОЗДАНИЕ ПРОФИЛЯ", user=username, details="Профиль создан")
             
             if self.bus:
@@ -139,9 +220,14 @@ class ProfileService:
         username = data.get("username")
         updates = data.get("updates", {})
         
-        users = load_json(USERS_FILE)
+        store = get_store()
+        with store.locked("users"):
+            user = store.get("users", username)
+            if user is not None:
+                user.update(updates)
+                store.put("users", username, user)
         
-        if username in users:
-            users[username].update(updates)
-            save_json(USERS_FILE, users)
+        if user is not None:
+            # Роль и другие данные могли измениться - сессии пользователя недействительны
+            get_sessions().invalidate_user(username)
             log_action("ОБНОВЛЕНИЕ ПРОФИЛЯ", user=username, details=str(updates))
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Локальный тестовый SMTP сервер: принимает письма и выводит их в консоль
+(или дописывает в файл). Используется для проверки доставки уведомлений
+через --notify-sink smtp без настоящего почтового сервера.
+
+Пример:
+    python smtp_stub.py --port 1025 --delay 0.3
+    python main.py --delivery-workers 4 --notify-sink smtp
+"""
+
+import argparse
+import socketserver
+import time
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    """Минимальный диалог SMTP: HELO/EHLO, MAIL, RCPT, DATA, QUIT."""
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 lb4 smtp stub")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 lb4")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data.decode(errors="replace"))
+                # Имитация задержки настоящего почтового сервера
+                time.sleep(self.server.delay)
+                self.server.save(recipients, "".join(lines))
+                self.reply("250 OK")
+            elif verb == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SmtpStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, delay=0, output=None):
+        super().__init__(address, SmtpHandler)
+        self.delay = delay
+        self.output = output
+
+    def save(self, recipients, message):
+        text = f"--- Письмо для {', '.join(recipients)} ---\n{message}\n"
+        if self.output:
+            with open(self.output, "a", encoding="utf-8") as f:
+                f.write(text)
+        else:
+            print(text)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Тестовый SMTP сервер")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--delay", type=float, default=0,
+                        help="задержка обработки письма, сек")
+    parser.add_argument("--output", help="файл для сохранения писем (по умолчанию - консоль)")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with SmtpStub((args.host, args.port), args.delay, args.output) as server:
+        print(f"SMTP сервер запущен на {args.host}:{args.port}")
+        server.serve_forever()
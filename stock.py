@@ -0,0 +1,251 @@
+import json
+import mmap
+import os
+import struct
+import threading
+from storage import DATA_DIR
+
+# Запись склада фиксированной длины: название (UTF-8, дополняется нулями),
+# доступный остаток, сумма резервов, цена
+NAME_BYTES = 48
+RECORD = struct.Struct(f"<{NAME_BYTES}sqqd")
+HEADER = struct.Struct("<8sQ")
+MAGIC = b"LB4STOCK"
+
+
+class StockTable:
+    """
+    Движок складских остатков: quantity/reserved_total/price каждого товара
+    хранятся в файле записей фиксированной длины, отображенном в память (mmap).
+    Проверка, резерв и возврат - изменение одной записи на месте за O(1)
+    без разбора и записи JSON. Описание товаров остается в JSON хранилище.
+    - slots: индекс {название: номер записи}, строится при открытии
+    - free: свободные записи (после удаления товаров)
+    - ledger: резервы заказов {order_id: {название: количество}}; изменения
+      дописываются в журнал stock.ledger, при открытии журнал применяется заново
+    Файл рассчитан на один процесс; изменения записей защищены блокировкой потоков.
+    """
+
+    STOCK_FILE = "stock.bin"
+    LEDGER_FILE = "stock.ledger"
+
+    def __init__(self, data_dir=DATA_DIR, capacity=1024):
+        self.path = os.path.join(data_dir, self.STOCK_FILE)
+        self.ledger_path = os.path.join(data_dir, self.LEDGER_FILE)
+        self.lock = threading.Lock()
+        self.is_new = not os.path.exists(self.path)
+        if self.is_new:
+            os.makedirs(data_dir, exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, capacity))
+                f.truncate(HEADER.size + capacity * RECORD.size)
+        self.file = open(self.path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, self.capacity = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path}: неизвестный формат файла")
+        self._build_index()
+        self._load_ledger()
+
+    def _offset(self, slot):
+        return HEADER.size + slot * RECORD.size
+
+    def _build_index(self):
+        self.slots = {}
+        self.free = []
+        for slot in range(self.capacity):
+            name = RECORD.unpack_from(self.mm, self._offset(slot))[0].rstrip(b"\0")
+            if name:
+                self.slots[name.decode("utf-8")] = slot
+            else:
+                self.free.append(slot)
+        self.free.reverse()
+
+    def _load_ledger(self):
+        self.ledger = {}
+        if os.path.exists(self.ledger_path):
+            with open(self.ledger_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        order_id, item_name, quantity = json.loads(line)
+                    except ValueError:
+                        break  # недописанная строка при сбое
+                    self._apply(order_id, item_name, quantity)
+        self._compact_ledger()
+
+    def _apply(self, order_id, item_name, quantity):
+        items = self.ledger.setdefault(order_id, {})
+        items[item_name] = items.get(item_name, 0) + quantity
+        if items[item_name] <= 0:
+            del items[item_name]
+        if not items:
+            del self.ledger[order_id]
+
+    def _log(self, order_id, item_name, quantity):
+        self._apply(order_id, item_name, quantity)
+        self.ledger_file.write(json.dumps([order_id, item_name, quantity], ensure_ascii=False) + "\n")
+        self.ledger_file.flush()
+
+    def _compact_ledger(self):
+        """Переписывает журнал резервов: только активные резервы."""
+        tmp_path = self.ledger_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for order_id, items in self.ledger.items():
+                for item_name, quantity in items.items():
+                    f.write(json.dumps([order_id, item_name, quantity], ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.ledger_path)
+        self.ledger_file = open(self.ledger_path, "a", encoding="utf-8")
+
+    def _grow(self):
+        """Удваивает число записей в файле."""
+        old = self.capacity
+        self.capacity *= 2
+        self.mm.close()
+        self.file.truncate(self._offset(self.capacity))
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        HEADER.pack_into(self.mm, 0, MAGIC, self.capacity)
+        self.free.extend(range(self.capacity - 1, old - 1, -1))
+
+    def _read(self, slot):
+        name, quantity, reserved, price = RECORD.unpack_from(self.mm, self._offset(slot))
+        return quantity, reserved, price
+
+    def _write(self, slot, name, quantity, reserved, price):
+        RECORD.pack_into(self.mm, self._offset(slot), name.encode("utf-8"), quantity, reserved, price)
+
+    def get(self, item_name):
+        """Возвращает {"quantity", "reserved_total", "price"} товара или None."""
+        slot = self.slots.get(item_name)
+        if slot is None:
+            return None
+        quantity, reserved, price = self._read(slot)
+        return {"quantity": quantity, "reserved_total": reserved, "price": price}
+
+    @staticmethod
+    def fits(item_name):
+        """Помещается ли название товара в запись (NAME_BYTES байт UTF-8)."""
+        return len(item_name.encode("utf-8")) <= NAME_BYTES
+
+    def put(self, item_name, quantity=None, price=None):
+        """Добавляет товар или изменяет его остаток и цену."""
+        if not self.fits(item_name):
+            print(f"[StockTable] Слишком длинное название товара: {item_name}")
+            return False
+        with self.lock:
+            slot = self.slots.get(item_name)
+            if slot is None:
+                if not self.free:
+                    self._grow()
+                slot = self.free.pop()
+                self.slots[item_name] = slot
+                old = (0, 0, 0.0)
+            else:
+                old = self._read(slot)
+            self._write(slot, item_name,
+                        old[0] if quantity is None else quantity, old[1],
+                        old[2] if price is None else price)
+        return True
+
+    def remove(self, item_name):
+        with self.lock:
+            slot = self.slots.pop(item_name, None)
+            if slot is not None:
+                self.mm[self._offset(slot):self._offset(slot + 1)] = bytes(RECORD.size)
+                self.free.append(slot)
+
+    def reserve(self, item_name, quantity, order_id):
+        """Резервирует товар: уменьшает остаток, если его хватает."""
+        with self.lock:
+            slot = self.slots.get(item_name)
+            if slot is None:
+                return False
+            available, reserved, price = self._read(slot)
+            if available < quantity:
+                return False
+            self._write(slot, item_name, available - quantity, reserved + quantity, price)
+            self._log(order_id, item_name, quantity)
+        return True
+
+    def reserve_all(self, needed, order_id):
+        """Резервирует несколько товаров по принципу "все или ничего". Возвращает недостающие."""
+        with self.lock:
+            missing = [name for name, quantity in needed.items()
+                       if name not in self.slots or self._read(self.slots[name])[0] < quantity]
+            if missing:
+                return missing
+            for name, quantity in needed.items():
+                slot = self.slots[name]
+                available, reserved, price = self._read(slot)
+                self._write(slot, name, available - quantity, reserved + quantity, price)
+                self._log(order_id, name, quantity)
+        return []
+
+    def release(self, item_name, quantity=None, order_id=None, restock=True):
+        """
+        Снимает резерв (с order_id - весь резерв заказа по товару) и,
+        если restock, возвращает количество в остаток. Возвращает количество.
+        """
+        with self.lock:
+            slot = self.slots.get(item_name)
+            if slot is None:
+                return 0
+            available, reserved, price = self._read(slot)
+            if order_id is not None:
+                quantity = self.ledger.get(order_id, {}).get(item_name, 0)
+                if quantity:
+                    self._log(order_id, item_name, -quantity)
+                reserved -= quantity
+            if restock:
+                available += quantity
+            self._write(slot, item_name, available, reserved, price)
+        return quantity
+
+    def order_items(self, order_id):
+        """Товары, зарезервированные заказом."""
+        return list(self.ledger.get(order_id, {}))
+
+    def overlay(self, inventory):
+        """Подставляет остатки из таблицы в записи склада из JSON (для просмотра)."""
+        merged = {}
+        for item_name, details in inventory.items():
+            stock = self.get(item_name)
+            merged[item_name] = dict(details, **stock) if stock else details
+        return merged
+
+    def import_inventory(self, inventory):
+        """Заполняет новую таблицу из записей склада JSON хранилища."""
+        for item_name, details in inventory.items():
+            self.put(item_name, details.get("quantity", 0), details.get("price", 0))
+            with self.lock:
+                for order_id, quantity in details.get("reserved", {}).items():
+                    available, reserved, price = self._read(self.slots[item_name])
+                    self._write(self.slots[item_name], item_name, available, reserved + quantity, price)
+                    self._log(order_id, item_name, quantity)
+
+    def flush(self):
+        with self.lock:
+            self.mm.flush()
+            self.ledger_file.flush()
+            os.fsync(self.ledger_file.fileno())
+
+    def close(self):
+        self.flush()
+        self.ledger_file.close()
+        self._compact_ledger()
+        self.ledger_file.close()
+        self.mm.close()
+        self.file.close()
+
+
+_stock = None
+
+def get_stock():
+    """Возвращает движок остатков (None - остатки хранятся в JSON хранилище)."""
+    return _stock
+
+def set_stock(stock):
+    """Включает движок остатков (None - выключает), закрывая предыдущий."""
+    global _stock
+    if _stock is not None and _stock is not stock:
+        _stock.close()
+    _stock = stock
@@ -0,0 +1,718 @@
+import contextlib
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+from utils import FileCache, FileLock, load_json, save_json
+
+DATA_DIR = "data"
+
+# Таблицы хранилища и соответствующие им файлы
+TABLES = {
+    "users": "users.json",
+    "inventory": "inventory.json",
+    "orders": "orders.json",
+    "idempotency": "idempotency.json",
+    "deliveries": "deliveries.json"
+}
+
+# Поля записей, по которым ведутся вторичные индексы
+INDEXED_FIELDS = {
+    "users": [],
+    "inventory": [],
+    "orders": ["username", "status"],
+    "idempotency": [],
+    "deliveries": []
+}
+
+# Таблицы, записи которых несут номер версии (увеличивается при каждом put)
+VERSIONED_TABLES = ("inventory", "orders")
+
+
+def _bump_version(table, value):
+    if table in VERSIONED_TABLES:
+        value["version"] = value.get("version", 0) + 1
+
+
+class Store:
+    """
+    Интерфейс хранилища (репозитория) данных.
+    Записи - словари, доступ по имени таблицы и ключу. Возвращаемые записи
+    можно изменять, но изменения сохраняются только через put.
+    """
+
+    def get(self, table, key, default=None):
+        raise NotImplementedError
+
+    def all(self, table):
+        raise NotImplementedError
+
+    def put(self, table, key, value):
+        raise NotImplementedError
+
+    def delete(self, table, key):
+        raise NotImplementedError
+
+    def find(self, table, field, value):
+        """Возвращает ключи записей с заданным значением индексируемого поля."""
+        raise NotImplementedError
+
+    def commit(self):
+        """Граница транзакции: фиксирует изменения (с учетом flush_interval)."""
+        raise NotImplementedError
+
+    def locked(self, table):
+        """
+        Блокировка цикла "прочитать-изменить-записать" над таблицей.
+        По умолчанию - только внутри процесса.
+        """
+        return self.lock
+
+    def compare_and_put(self, table, key, value, version):
+        """
+        Сохраняет запись, только если версия в хранилище равна version.
+        Версия сначала проверяется без блокировки: устаревшее изменение отклоняется
+        сразу, не дожидаясь блокировки таблицы (в общем режиме - файла с перечитыванием
+        и записью всей таблицы); под блокировкой проверка повторяется.
+        Сама запись по-прежнему выполняется под блокировкой таблицы: JSON таблица
+        записывается целиком.
+        """
+        current = self.get(table, key)
+        if current is None or current.get("version", 0) != version:
+            return False
+        with self.locked(table):
+            current = self.get(table, key)
+            if current is None or current.get("version", 0) != version:
+                return False
+            self.put(table, key, value)
+            return True
+
+    def update(self, table, key, change, retries=10):
+        """
+        Изменяет запись по принципу compare-and-swap: change получает копию
+        записи и возвращает измененную (None - изменение не требуется/невозможно).
+        При конфликте версий (запись изменил другой поток или процесс) цикл повторяется.
+        Возвращает сохраненную запись или None.
+        """
+        for _ in range(retries):
+            current = self.get(table, key)
+            if current is None:
+                return None
+            version = current.get("version", 0)
+            value = change(copy.deepcopy(current))
+            if value is None:
+                return None
+            if self.compare_and_put(table, key, value, version):
+                return value
+        print(f"[Store] Не удалось изменить {table}/{key}: конфликт версий")
+        return None
+
+    def flush(self):
+        """Немедленно фиксирует все изменения."""
+        raise NotImplementedError
+
+    flush_listeners = ()
+
+    def add_flush_listener(self, listener):
+        """
+        Подписывает объект на запись изменений на диск (очередь событий шины):
+        listener.before_flush() вызывается перед записью, listener.after_flush() - после.
+        """
+        self.flush_listeners = self.flush_listeners + (listener,)
+
+    def remove_flush_listener(self, listener):
+        self.flush_listeners = tuple(l for l in self.flush_listeners if l is not listener)
+
+    def _before_flush(self):
+        for listener in self.flush_listeners:
+            listener.before_flush()
+
+    def _after_flush(self):
+        for listener in self.flush_listeners:
+            listener.after_flush()
+
+    def rollback(self):
+        """
+        Отменяет незафиксированные изменения цепочки, завершившейся ошибкой.
+        JSON хранилища общие для всех потоков и откат не поддерживают:
+        изменения остаются в памяти и записываются следующим commit.
+        """
+
+    flusher = None
+
+    def _start_flusher(self):
+        """
+        Запускается, когда commit откладывает запись (flush_interval): фоновый поток
+        раз в flush_interval фиксирует накопленные изменения, чтобы они
+        не оставались в памяти после последнего действия.
+        """
+        if self.flusher is None:
+            self.stopped = threading.Event()
+            self.flusher = threading.Thread(target=self._run_flusher, daemon=True)
+            self.flusher.start()
+
+    def _run_flusher(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.commit()
+
+    def _stop_flusher(self):
+        if self.flusher is not None:
+            self.stopped.set()
+            self.flusher.join()
+            self.flusher = None
+
+    def close(self):
+        self._stop_flusher()
+        self.flush()
+
+
+class JsonStore(Store):
+    """
+    Общее хранилище данных в памяти с отложенной записью в JSON файлы.
+    - tables: загруженные таблицы {table: {key: value}}
+    - dirty: измененные ключи {table: set(keys)}
+    - indexes: вторичные индексы {(table, field): {value: set(keys)}}
+    - indexed_values: проиндексированные значения {(table, field): {key: value}}
+    - flush_interval: минимальный интервал между записями на диск (сек), 0 - запись на каждом commit
+      (отложенные commit изменения записывает фоновый поток не позже чем через flush_interval)
+    - lock: блокировка для изменений из нескольких потоков; сервисы держат ее
+      на время цикла "прочитать-изменить-записать"
+    - files: при shared=True (каталог данных общий для нескольких процессов) -
+      FileCache; таблица без несохраненных изменений перечитывается,
+      если файл изменил другой процесс
+    - file_locks: блокировки файлов таблиц между процессами (shared=True);
+      при записи свои измененные ключи накладываются на версию файла другого процесса
+    """
+
+    def __init__(self, data_dir=DATA_DIR, flush_interval=0, shared=False):
+        self.data_dir = data_dir
+        self.flush_interval = flush_interval
+        self.files = FileCache() if shared else None
+        self.file_locks = {}
+        self.tables = {}
+        self.dirty = {}
+        self.indexes = {}
+        self.indexed_values = {}
+        self.last_flush = time.monotonic()
+        self.lock = threading.RLock()
+
+    def _path(self, table):
+        return os.path.join(self.data_dir, TABLES[table])
+
+    def _table(self, table):
+        """Возвращает таблицу, загружая файл только при первом обращении (или при изменении другим процессом)."""
+        if table not in self.tables:
+            with self.lock:
+                if table not in self.tables:
+                    self._load(table)
+        elif self.files is not None and table not in self.dirty and self.files.changed(self._path(table)):
+            with self.lock:
+                if table not in self.dirty:
+                    self._load(table)
+        return self.tables[table]
+
+    def _load(self, table):
+        path = self._path(table)
+        self.tables[table] = self.files.load(path) if self.files is not None else load_json(path)
+        self._build_indexes(table)
+
+    def _build_indexes(self, table):
+        for field in INDEXED_FIELDS[table]:
+            self.indexes[(table, field)] = {}
+            self.indexed_values[(table, field)] = {}
+        for key, value in self.tables[table].items():
+            self._index(table, key, value)
+
+    def _index(self, table, key, value):
+        """Обновляет индексы для записи (value=None - запись удалена)."""
+        for field in INDEXED_FIELDS[table]:
+            index = self.indexes[(table, field)]
+            values = self.indexed_values[(table, field)]
+            new = value.get(field) if value is not None else None
+            if key in values:
+                old = values[key]
+                if value is not None and old == new:
+                    continue
+                index[old].discard(key)
+                if not index[old]:
+                    del index[old]
+                del values[key]
+            if value is not None:
+                index.setdefault(new, set()).add(key)
+                values[key] = new
+
+    def get(self, table, key, default=None):
+        """Возвращает запись по ключу."""
+        return self._table(table).get(key, default)
+
+    def all(self, table):
+        """
+        Возвращает снимок таблицы (только для чтения): копия словаря снимается
+        под блокировкой, чтобы другие потоки могли добавлять и удалять записи во время обхода.
+        """
+        rows = self._table(table)
+        with self.lock:
+            return dict(rows)
+
+    def put(self, table, key, value):
+        """Сохраняет запись (увеличивая версию) и помечает ключ измененным."""
+        with self.lock:
+            _bump_version(table, value)
+            self._table(table)[key] = value
+            self._index(table, key, value)
+            self.dirty.setdefault(table, set()).add(key)
+
+    def delete(self, table, key):
+        """Удаляет запись и помечает ключ измененным."""
+        with self.lock:
+            if self._table(table).pop(key, None) is not None:
+                self._index(table, key, None)
+                self.dirty.setdefault(table, set()).add(key)
+
+    def find(self, table, field, value):
+        """Возвращает ключи записей по индексу (время пропорционально размеру результата)."""
+        self._table(table)
+        with self.lock:
+            return list(self.indexes[(table, field)].get(value, ()))
+
+    def commit(self):
+        """
+        Граница транзакции: записывает изменения на диск,
+        если с последней записи прошло не меньше flush_interval.
+        """
+        if not self.dirty:
+            return
+        with self.lock:
+            if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+            elif self.dirty:
+                self._start_flusher()
+
+    def _file_lock(self, table):
+        if table not in self.file_locks:
+            self.file_locks[table] = FileLock(self._path(table) + ".lock")
+        return self.file_locks[table]
+
+    @contextlib.contextmanager
+    def locked(self, table):
+        """
+        Блокировка таблицы: в общем режиме дополнительно блокируется файл,
+        таблица перечитывается с диска, а изменения записываются до снятия блокировки.
+        """
+        with self.lock:
+            if self.files is None:
+                yield
+                return
+            with self._file_lock(table):
+                if table in self.dirty:
+                    self._save_table(table)
+                self._table(table)
+                yield
+                if table in self.dirty:
+                    self._save_table(table)
+
+    def _save_table(self, table):
+        """Записывает таблицу; в общем режиме - поверх изменений других процессов."""
+        self._before_flush()
+        path = self._path(table)
+        if self.files is None:
+            save_json(path, self.tables[table])
+        else:
+            with self._file_lock(table):
+                if self.files.changed(path):
+                    rows = self.tables[table]
+                    fresh = self.files.load(path)
+                    for key in self.dirty[table]:
+                        if key in rows:
+                            fresh[key] = rows[key]
+                        else:
+                            fresh.pop(key, None)
+                    self.tables[table] = fresh
+                    self._build_indexes(table)
+                self.files.save(path, self.tables[table])
+        del self.dirty[table]
+
+    def flush(self):
+        """Записывает на диск все таблицы с измененными ключами."""
+        with self.lock:
+            self._before_flush()
+            for table in list(self.dirty):
+                self._save_table(table)
+            self.last_flush = time.monotonic()
+            self._after_flush()
+
+    def close(self):
+        self._stop_flusher()
+        self.flush()
+        for file_lock in self.file_locks.values():
+            file_lock.close()
+
+
+class JournalStore(JsonStore):
+    """
+    Хранилище с журналом изменений.
+    Каждый измененный ключ дописывается в журнал одной записью,
+    fsync выполняется один раз на flush. Снимки (JSON файлы) обновляются
+    только при сжатии журнала, при запуске снимки дополняются журналом.
+    - compact_every: количество записей журнала, после которого выполняется сжатие
+    """
+
+    JOURNAL_FILE = "journal.log"
+
+    def __init__(self, data_dir=DATA_DIR, flush_interval=0, compact_every=1000):
+        super().__init__(data_dir, flush_interval)
+        self.compact_every = compact_every
+        self.journal_path = os.path.join(data_dir, self.JOURNAL_FILE)
+        self.journal_size = 0
+        self._replay()
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _replay(self):
+        """Загружает снимки и применяет к ним записи журнала."""
+        for table in TABLES:
+            self._table(table)
+        if not os.path.exists(self.journal_path):
+            return
+        valid_size = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                # Недописанная запись при сбое - дальше журнал не читаем
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    break
+                table = self.tables[record["table"]]
+                if record["op"] == "put":
+                    table[record["key"]] = record["value"]
+                else:
+                    table.pop(record["key"], None)
+                self.journal_size += 1
+                valid_size += len(line)
+        # Отрезаем поврежденный хвост, чтобы новые записи не оказались за ним
+        os.truncate(self.journal_path, valid_size)
+        for table in TABLES:
+            self._build_indexes(table)
+
+    def flush(self):
+        """Дописывает измененные ключи в журнал одной пачкой."""
+        with self.lock:
+            self._before_flush()
+            lines = []
+            for table, keys in self.dirty.items():
+                rows = self.tables[table]
+                for key in keys:
+                    if key in rows:
+                        record = {"op": "put", "table": table, "key": key, "value": rows[key]}
+                    else:
+                        record = {"op": "del", "table": table, "key": key}
+                    lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+            if lines:
+                self.journal.write("".join(lines))
+                self.journal.flush()
+                os.fsync(self.journal.fileno())
+                self.journal_size += len(lines)
+            self.dirty = {}
+            self.last_flush = time.monotonic()
+            self._after_flush()
+            if self.journal_size >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """Сворачивает журнал в снимки и очищает его."""
+        with self.lock:
+            for table, rows in self.tables.items():
+                save_json(self._path(table), rows)
+            self.journal.truncate(0)
+            self.journal_size = 0
+
+    def close(self):
+        self._stop_flusher()
+        self.flush()
+        self.compact()
+        self.journal.close()
+
+
+class ShardedStore(JsonStore):
+    """
+    Хранилище с разбиением таблиц inventory и orders на шарды по хэшу ключа
+    (data/shards/<table>-NN.json): операция с одной записью читает и записывает
+    только ее шард, объем ввода-вывода не зависит от размера каталога.
+    Число шардов таблиц хранится в манифесте shards/manifest.json;
+    остальные таблицы (users) - обычные JSON файлы.
+    При первом запуске существующие JSON файлы раскладываются по шардам.
+    Шарды уменьшают объем записи, но не конкуренцию: блокировки по шардам нет,
+    изменения и flush выполняются под общей блокировкой хранилища, locked(table)
+    блокирует всю таблицу; общий режим (shared) не поддерживается.
+    - shards: загруженные шарды {(table, n): {key: value}}
+    - indexed: таблицы, для которых построены индексы (строятся при первом find
+      и требуют загрузки всех шардов таблицы)
+    """
+
+    SHARDED_TABLES = ("inventory", "orders")
+    SHARDS_DIR = "shards"
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(self, data_dir=DATA_DIR, flush_interval=0, shard_count=16):
+        super().__init__(data_dir, flush_interval)
+        self.shards_dir = os.path.join(data_dir, self.SHARDS_DIR)
+        self.shards = {}
+        self.indexed = set()
+        manifest_path = os.path.join(self.shards_dir, self.MANIFEST_FILE)
+        manifest = load_json(manifest_path)
+        if not manifest:
+            manifest = {"shards": {table: shard_count for table in self.SHARDED_TABLES}}
+            self._import_json(manifest["shards"])
+            # Манифест записывается последним: прерванный импорт повторится при следующем запуске
+            save_json(manifest_path, manifest)
+        self.shard_counts = manifest["shards"]
+
+    def _import_json(self, shard_counts):
+        """Раскладывает записи из JSON файлов по шардам."""
+        for table, count in shard_counts.items():
+            shards = [{} for _ in range(count)]
+            for key, value in load_json(self._path(table)).items():
+                shards[zlib.crc32(key.encode("utf-8")) % count][key] = value
+            for n, rows in enumerate(shards):
+                save_json(self._shard_path(table, n), rows)
+
+    def _shard_no(self, table, key):
+        # crc32, а не hash(): номер шарда должен совпадать между запусками
+        return zlib.crc32(key.encode("utf-8")) % self.shard_counts[table]
+
+    def _shard_path(self, table, n):
+        return os.path.join(self.shards_dir, f"{table}-{n:02d}.json")
+
+    def _shard(self, table, n):
+        """Возвращает шард, загружая файл только при первом обращении."""
+        if (table, n) not in self.shards:
+            with self.lock:
+                if (table, n) not in self.shards:
+                    self.shards[(table, n)] = load_json(self._shard_path(table, n))
+        return self.shards[(table, n)]
+
+    def get(self, table, key, default=None):
+        if table not in self.shard_counts:
+            return super().get(table, key, default)
+        return self._shard(table, self._shard_no(table, key)).get(key, default)
+
+    def all(self, table):
+        """Возвращает снимок всей таблицы (загружает все шарды)."""
+        if table not in self.shard_counts:
+            return super().all(table)
+        rows = {}
+        with self.lock:
+            for n in range(self.shard_counts[table]):
+                rows.update(self._shard(table, n))
+        return rows
+
+    def put(self, table, key, value):
+        if table not in self.shard_counts:
+            return super().put(table, key, value)
+        with self.lock:
+            _bump_version(table, value)
+            self._shard(table, self._shard_no(table, key))[key] = value
+            if table in self.indexed:
+                self._index(table, key, value)
+            self.dirty.setdefault(table, set()).add(key)
+
+    def delete(self, table, key):
+        if table not in self.shard_counts:
+            return super().delete(table, key)
+        with self.lock:
+            if self._shard(table, self._shard_no(table, key)).pop(key, None) is not None:
+                if table in self.indexed:
+                    self._index(table, key, None)
+                self.dirty.setdefault(table, set()).add(key)
+
+    def find(self, table, field, value):
+        if table not in self.shard_counts:
+            return super().find(table, field, value)
+        with self.lock:
+            if table not in self.indexed:
+                for indexed_field in INDEXED_FIELDS[table]:
+                    self.indexes[(table, indexed_field)] = {}
+                    self.indexed_values[(table, indexed_field)] = {}
+                for key, row in self.all(table).items():
+                    self._index(table, key, row)
+                self.indexed.add(table)
+            return list(self.indexes[(table, field)].get(value, ()))
+
+    def flush(self):
+        """Записывает измененные шарды (и обычные таблицы)."""
+        with self.lock:
+            self._before_flush()
+            for table, keys in self.dirty.items():
+                if table in self.shard_counts:
+                    for n in {self._shard_no(table, key) for key in keys}:
+                        save_json(self._shard_path(table, n), self.shards[(table, n)])
+                else:
+                    save_json(self._path(table), self.tables[table])
+            self.dirty = {}
+            self.last_flush = time.monotonic()
+            self._after_flush()
+
+
+class _Connection(sqlite3.Connection):
+    """Соединение SQLite, на которое можно держать слабую ссылку."""
+
+
+class SqliteStore(Store):
+    """
+    Хранилище в базе SQLite (режим WAL): построчные изменения и транзакции.
+    Запись хранится в колонке data (JSON), поля из INDEXED_FIELDS
+    дублируются в отдельные колонки с индексами (для find).
+    При создании новой базы в нее импортируются существующие JSON файлы.
+    У каждого потока свое соединение: чтение идет параллельно, а изменения
+    цепочки событий - одна транзакция потока, которую фиксирует commit
+    (или отменяет rollback) на границе цепочки.
+    - locked: начинает транзакцию записи (BEGIN IMMEDIATE), поэтому чтение
+      внутри "прочитать-изменить-записать" видит изменения других потоков,
+      а они ждут фиксации этой транзакции
+    - flush_interval не откладывает фиксацию: открытая транзакция держит
+      блокировку записи; фиксация в режиме WAL с synchronous=NORMAL дешевая
+    """
+
+    DB_FILE = "store.db"
+
+    # Ключевая колонка для каждой таблицы
+    KEY_COLUMNS = {"users": "username", "inventory": "item_name", "orders": "order_id", "idempotency": "key",
+                   "deliveries": "key"}
+
+    def __init__(self, data_dir=DATA_DIR, flush_interval=0):
+        self.data_dir = data_dir
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Слабые ссылки: соединение завершившегося потока закрывается сборщиком мусора
+        self.connections = weakref.WeakSet()
+        os.makedirs(data_dir, exist_ok=True)
+        self.db_path = os.path.join(data_dir, self.DB_FILE)
+        is_new = not os.path.exists(self.db_path)
+        self._conn().execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+        if is_new:
+            self._import_json()
+
+    def _conn(self):
+        """Соединение текущего потока (создается при первом обращении)."""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, factory=_Connection, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            with self.lock:
+                self.connections.add(conn)
+        return conn
+
+    def _create_schema(self):
+        conn = self._conn()
+        for table, key_column in self.KEY_COLUMNS.items():
+            columns = "".join(f", {field} TEXT" for field in INDEXED_FIELDS[table])
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({key_column} TEXT PRIMARY KEY{columns}, data TEXT NOT NULL)")
+            for field in INDEXED_FIELDS[table]:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{field} ON {table} ({field})")
+        conn.commit()
+
+    def _import_json(self):
+        """Переносит данные из JSON файлов в новую базу."""
+        for table, filename in TABLES.items():
+            for key, value in load_json(os.path.join(self.data_dir, filename)).items():
+                self.put(table, key, value)
+        self.flush()
+
+    def get(self, table, key, default=None):
+        row = self._conn().execute(
+            f"SELECT data FROM {table} WHERE {self.KEY_COLUMNS[table]} = ?", (key,)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def all(self, table):
+        rows = self._conn().execute(f"SELECT {self.KEY_COLUMNS[table]}, data FROM {table}").fetchall()
+        return {key: json.loads(data) for key, data in rows}
+
+    def put(self, table, key, value):
+        _bump_version(table, value)
+        fields = INDEXED_FIELDS[table]
+        columns = ", ".join([self.KEY_COLUMNS[table]] + fields + ["data"])
+        placeholders = ", ".join("?" * (len(fields) + 2))
+        params = [key] + [value.get(field) for field in fields] + [json.dumps(value, ensure_ascii=False)]
+        self._conn().execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})", params)
+
+    def delete(self, table, key):
+        self._conn().execute(f"DELETE FROM {table} WHERE {self.KEY_COLUMNS[table]} = ?", (key,))
+
+    def find(self, table, field, value):
+        rows = self._conn().execute(
+            f"SELECT {self.KEY_COLUMNS[table]} FROM {table} WHERE {field} = ?", (value,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    @contextlib.contextmanager
+    def locked(self, table):
+        """Блокировка "прочитать-изменить-записать": транзакция записи потока."""
+        conn = self._conn()
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        yield
+
+    def commit(self):
+        """Фиксирует транзакцию текущего потока."""
+        self.flush()
+
+    def rollback(self):
+        """Отменяет транзакцию текущего потока."""
+        conn = self._conn()
+        if conn.in_transaction:
+            conn.rollback()
+
+    def flush(self):
+        self._before_flush()
+        conn = self._conn()
+        if conn.in_transaction:
+            conn.commit()
+        self._after_flush()
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            for conn in list(self.connections):
+                conn.close()
+
+
+def create_store(mode="json", data_dir=DATA_DIR, flush_interval=0, shared=False):
+    """
+    Создает хранилище по названию режима (json, journal, sharded, sqlite).
+    shared - каталог данных используется несколькими процессами (только для json).
+    """
+    if shared and mode != "json":
+        raise ValueError(f"Общий каталог данных (shared) поддерживается только хранилищем json, не {mode}")
+    if mode == "journal":
+        return JournalStore(data_dir, flush_interval)
+    if mode == "sharded":
+        return ShardedStore(data_dir, flush_interval)
+    if mode == "sqlite":
+        return SqliteStore(data_dir, flush_interval)
+    return JsonStore(data_dir, flush_interval, shared)
+
+
+_store = None
+
+def get_store():
+    """Возвращает текущее хранилище (по умолчанию - JsonStore)."""
+    global _store
+    if _store is None:
+        _store = JsonStore()
+    return _store
+
+def set_store(store):
+    """Заменяет текущее хранилище, предварительно сбрасывая старое на диск."""
+    global _store
+    if _store is not None and _store is not store:
+        _store.close()
+    _store = store
@@ -0,0 +1,41 @@
+import os
+import threading
+from main import bootstrap, shutdown
+from storage import get_store
+
+
+def start(tmp_path, **options):
+    data_dir = str(tmp_path / "data")
+    return bootstrap(quiet=True, data_dir=data_dir, log_path=str(tmp_path / "logs.txt"),
+                     events_dir=str(tmp_path / "logs"), **options)
+
+
+def test_burst_of_orders_does_not_deadlock(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    # Отложенная запись, чтобы замер не упирался в сохранение JSON после каждого события
+    app = start(tmp_path, async_bus=True, flush_interval=1)
+    bus = app["bus"]
+    get_store().put("inventory", "Мышь", {"quantity": 100000, "price": 500.0, "reserved": {}, "reserved_total": 0})
+    get_store().flush()
+
+    def sender():
+        for _ in range(100):
+            bus.send("order", {"action": "create_order", "username": "user",
+                               "items": [{"item_name": "Мышь", "quantity": 1}]})
+
+    threads = [threading.Thread(target=sender, daemon=True) for _ in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+        assert not thread.is_alive(), "отправка заказов зависла"
+
+    waiter = threading.Thread(target=bus.wait, daemon=True)
+    waiter.start()
+    waiter.join(60)
+    assert not waiter.is_alive(), "очереди шины не опустели"
+
+    orders = get_store().all("orders")
+    assert len(orders) == 3200
+    assert all(order["status"] == "in_delivery" for order in orders.values())
+    shutdown(app)
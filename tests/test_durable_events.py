@@ -0,0 +1,74 @@
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+from main import bootstrap, shutdown
+from storage import get_store
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Заказ в процессе, который завершается аварийно сразу после обработки цепочки
+CRASH = textwrap.dedent("""
+    import os, sys
+    sys.path.insert(0, {root!r})
+    from main import bootstrap
+    from storage import get_store
+    app = bootstrap(quiet=True, storage={storage!r}, durable_events=True, data_dir="data",
+                    log_path="logs.txt", events_dir="logs")
+    store = get_store()
+    store.put("inventory", "X", {{"quantity": 10, "price": 1.0, "reserved": {{}}, "reserved_total": 0}})
+    store.commit()
+    order_id = app["bus"].request("order", {{"action": "create_order", "username": "u",
+                                             "items": [{{"item_name": "X", "quantity": 3}}]}})
+    print(order_id)
+    os._exit(0)
+""")
+
+
+def crash(tmp_path, storage):
+    output = subprocess.run([sys.executable, "-c", CRASH.format(root=ROOT, storage=storage)],
+                            cwd=tmp_path, capture_output=True, text=True, check=True).stdout
+    return output.strip().splitlines()[-1]
+
+
+def restart(tmp_path, storage):
+    return bootstrap(quiet=True, storage=storage, durable_events=True, data_dir=str(tmp_path / "data"),
+                     log_path=str(tmp_path / "logs.txt"), events_dir=str(tmp_path / "logs"))
+
+
+def check_applied_once(order_id):
+    store = get_store()
+    assert store.get("orders", order_id)["status"] == "in_delivery"
+    item = store.get("inventory", "X")
+    assert item["quantity"] == 7
+    assert item["reserved_total"] == 0
+
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_committed_chain_is_not_applied_twice_after_crash(tmp_path, monkeypatch, storage):
+    monkeypatch.chdir(tmp_path)
+    order_id = crash(tmp_path, storage)
+    app = restart(tmp_path, storage)
+    assert app["bus"].queue.pending() == []
+    check_applied_once(order_id)
+    shutdown(app)
+
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_lost_acks_do_not_apply_handlers_twice(tmp_path, monkeypatch, storage):
+    monkeypatch.chdir(tmp_path)
+    order_id = crash(tmp_path, storage)
+    # Сбой питания до fsync подтверждений: изменения хранилища на диске, подтверждений нет
+    events_dir = tmp_path / "data" / "events"
+    for path in events_dir.glob("acks-*.log"):
+        path.write_bytes(b"")
+    app = restart(tmp_path, storage)
+    check_applied_once(order_id)
+    shutdown(app)
+
+    # Повторные доставки подтверждены, отметки доставок удалены при следующем запуске
+    app = restart(tmp_path, storage)
+    assert app["bus"].queue.pending() == []
+    assert get_store().all("deliveries") == {}
+    shutdown(app)
@@ -0,0 +1,41 @@
+import pytest
+import utils
+from utils import FileCache, load_json, save_json
+
+
+@pytest.fixture
+def cache():
+    cache = FileCache()
+    if cache.inotify is None:
+        pytest.skip("inotify недоступен")
+    return cache
+
+
+def test_write_right_after_first_read_is_detected(cache, tmp_path, monkeypatch):
+    path = str(tmp_path / "table.json")
+    save_json(path, {"a": 1})
+
+    # Другой процесс записывает файл сразу после первого чтения
+    def load_then_write(filepath):
+        data = load_json(filepath)
+        save_json(filepath, {"a": 2})
+        return data
+
+    monkeypatch.setattr(utils, "load_json", load_then_write)
+    assert cache.load(path) == {"a": 1}
+    monkeypatch.setattr(utils, "load_json", load_json)
+    assert cache.changed(path)
+    assert cache.load(path) == {"a": 2}
+
+
+def test_queue_overflow_falls_back_to_stat(cache, tmp_path, monkeypatch):
+    path = str(tmp_path / "table.json")
+    save_json(path, {"a": 1})
+    assert cache.load(path) == {"a": 1}
+    save_json(path, {"a": 2})
+    # События потеряны при переполнении очереди
+    cache.inotify.changes()
+    monkeypatch.setattr(cache.inotify, "changes", lambda: None)
+    assert cache.changed(path)
+    assert cache.load(path) == {"a": 2}
+    assert not cache.changed(path)
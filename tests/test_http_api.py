@@ -0,0 +1,61 @@
+import http.client
+import json
+import threading
+import pytest
+from http_api import ApiHandler, ApiServer
+from main import bootstrap, shutdown
+from storage import get_store
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = bootstrap(quiet=True, data_dir=str(tmp_path / "data"), log_path=str(tmp_path / "logs.txt"),
+                    events_dir=str(tmp_path / "logs"))
+    server = ApiServer(("127.0.0.1", 0), app["bus"], quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    shutdown(app)
+
+
+def call(port, method, path, body=None, token=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+    response = conn.getresponse()
+    status, payload = response.status, json.loads(response.read())
+    conn.close()
+    return status, payload
+
+
+def test_register_and_login_require_username_and_password(api):
+    assert call(api, "POST", "/register", {})[0] == 400
+    assert call(api, "POST", "/register", {"username": "bob"})[0] == 400
+    assert call(api, "POST", "/login", {})[0] == 400
+    assert call(api, "POST", "/login", {"username": "bob"})[0] == 400
+    assert get_store().get("users", None) is None
+    assert get_store().get("users", "bob") is None
+
+
+def test_inventory_view_during_concurrent_changes(api):
+    # GET /inventory обходит склад, пока другие потоки добавляют товары
+    store = get_store()
+    done = threading.Event()
+
+    def writer():
+        for i in range(3000):
+            with store.locked("inventory"):
+                store.put("inventory", f"item{i}", {"quantity": 1, "price": 1.0, "reserved": {}, "reserved_total": 0})
+        done.set()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        while not done.is_set():
+            assert len(ApiHandler._view_inventory(None, [], {}, {})[1]) <= 3000
+    finally:
+        thread.join()
+    assert call(api, "GET", "/inventory")[0] == 200
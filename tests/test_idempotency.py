@@ -0,0 +1,34 @@
+import threading
+import time
+import pytest
+import services.base
+from main import bootstrap, shutdown
+from storage import get_store
+
+
+@pytest.mark.parametrize("storage", ["json", "sqlite"])
+def test_concurrent_retries_create_one_order(tmp_path, monkeypatch, storage):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(services.base, "_idempotency", None)
+    app = bootstrap(quiet=True, storage=storage, data_dir=str(tmp_path / "data"),
+                    log_path=str(tmp_path / "logs.txt"), events_dir=str(tmp_path / "logs"))
+    # Фиксация цепочки с задержкой: повтор успевает проснуться до commit первого вызова
+    store = get_store()
+    commit = store.commit
+    monkeypatch.setattr(store, "commit", lambda: (time.sleep(0.05), commit())[1])
+    results = []
+
+    def create():
+        results.append(app["bus"].request("order", {"action": "create_order", "username": "u",
+                                                    "idempotency_key": "k1",
+                                                    "items": [{"item_name": "X", "quantity": 1}]}))
+
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(results)) == 1
+    assert len(get_store().all("orders")) == 1
+    shutdown(app)
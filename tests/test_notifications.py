@@ -0,0 +1,36 @@
+import services.notification_services as notification_services
+from services.notification_services import NotificationDispatcher, SmtpSink
+
+
+class FlakySmtp:
+    """SMTP сервер, который один раз обрывает соединение на третьем письме."""
+
+    sent = []
+    failed = False
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send_message(self, message):
+        if len(FlakySmtp.sent) == 2 and not FlakySmtp.failed:
+            FlakySmtp.failed = True
+            raise OSError("соединение разорвано")
+        FlakySmtp.sent.append(message)
+
+
+def test_retry_sends_only_undelivered_messages(monkeypatch):
+    monkeypatch.setattr(notification_services.smtplib, "SMTP", FlakySmtp)
+    monkeypatch.setattr(FlakySmtp, "sent", [])
+    monkeypatch.setattr(FlakySmtp, "failed", False)
+    sink = SmtpSink()
+    monkeypatch.setattr(sink, "_message", lambda digest: digest["username"])
+    dispatcher = NotificationDispatcher([sink], workers=1, backoff=0.01)
+    dispatcher.deliver([{"username": f"user{i}"} for i in range(5)])
+    dispatcher.close()
+    assert FlakySmtp.sent == [f"user{i}" for i in range(5)]
@@ -0,0 +1,8 @@
+import pytest
+from storage import create_store
+
+
+@pytest.mark.parametrize("mode", ["journal", "sharded", "sqlite"])
+def test_shared_mode_is_only_for_json(tmp_path, mode):
+    with pytest.raises(ValueError):
+        create_store(mode, str(tmp_path), shared=True)
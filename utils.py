@@ -1,18 +1,276 @@
+import atexit
+import ctypes
+import glob
 import json
 import os
-from datetime import datetime
+import queue
+import struct
+import threading
+import time
 
-def log_action(action, user=None, details=None):
-    """Логирует действие в консоль с временной меткой"""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка действует только внутри процесса
+    fcntl = None
+
+LOG_FILE = "logs.txt"
+EVENTS_DIR = "logs"
+
+
+class EventLog:
+    """
+    Структурированный журнал действий в формате JSON Lines с ротацией по размеру.
+    Для текущего сегмента events-NNNN.jsonl ведется индекс events-NNNN.idx:
+    строки [ключ, смещение] для ключей order:<order_id> и user:<username>.
+    При ротации индекс закрытого сегмента сворачивается в events-NNNN.sidx:
+    по строке [ключ, [смещения]] на ключ, строки отсортированы по ключу
+    (поиск - двоичный, без чтения всего индекса).
+    - max_bytes: размер сегмента, после которого начинается новый
+    """
+
+    def __init__(self, log_dir=EVENTS_DIR, max_bytes=64 * 1024 * 1024):
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        os.makedirs(log_dir, exist_ok=True)
+        segments = sorted(glob.glob(os.path.join(log_dir, "events-*.jsonl")))
+        self.segment = int(segments[-1][-10:-6]) if segments else 1
+        # Индексы закрытых сегментов, не свернутые из-за остановки во время ротации
+        for index_path in glob.glob(os.path.join(log_dir, "events-*.idx")):
+            if int(index_path[-8:-4]) != self.segment:
+                _seal_index(index_path)
+        self._open()
+
+    def _open(self):
+        base = os.path.join(self.log_dir, f"events-{self.segment:04d}")
+        self.file = open(base + ".jsonl", "ab")
+        self.index = open(base + ".idx", "a", encoding="utf-8")
+        self.offset = self.file.tell()
+
+    def _rotate(self):
+        self.close()
+        _seal_index(self.index.name)
+        self.segment += 1
+        self._open()
+
+    def _write(self, lines, index_lines):
+        # Сначала данные, затем индекс: индекс не должен ссылаться на незаписанные строки
+        if lines:
+            self.file.write(b"".join(lines))
+            self.file.flush()
+            self.index.write("".join(index_lines))
+            self.index.flush()
+
+    def write(self, records):
+        """Дописывает пачку записей, при необходимости переходя к новому сегменту."""
+        lines = []
+        index_lines = []
+        for record in records:
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            if record.get("order_id"):
+                index_lines.append(json.dumps(["order:" + record["order_id"], self.offset], ensure_ascii=False) + "\n")
+            if record.get("user"):
+                index_lines.append(json.dumps(["user:" + record["user"], self.offset], ensure_ascii=False) + "\n")
+            lines.append(line)
+            self.offset += len(line)
+            if self.offset >= self.max_bytes:
+                self._write(lines, index_lines)
+                lines, index_lines = [], []
+                self._rotate()
+        self._write(lines, index_lines)
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+
+def _seal_index(index_path):
+    """Сворачивает индекс закрытого сегмента в отсортированный по ключам .sidx."""
+    offsets = {}
+    with open(index_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                key, offset = json.loads(line)
+            except ValueError:
+                break  # недописанная строка при сбое
+            offsets.setdefault(key, []).append(offset)
+    sorted_path = index_path[:-4] + ".sidx"
+    with open(sorted_path + ".tmp", "w", encoding="utf-8") as f:
+        for key in sorted(offsets):
+            f.write(json.dumps([key, offsets[key]], ensure_ascii=False) + "\n")
+    os.replace(sorted_path + ".tmp", sorted_path)
+    os.remove(index_path)
+
+
+def _search_sorted_index(path, key):
+    """
+    Двоичный поиск ключа в отсортированном индексе: ищется наименьшая позиция,
+    с которой начинается строка с ключом >= key. Возвращает смещения записей.
+    """
+    with open(path, "rb") as f:
+        def line_at(position):
+            # Первая строка, начинающаяся не раньше position
+            f.seek(max(position - 1, 0))
+            if position:
+                f.readline()
+            line = f.readline()
+            return json.loads(line) if line else None
+
+        low, high = 0, os.fstat(f.fileno()).st_size
+        while low < high:
+            middle = (low + high) // 2
+            entry = line_at(middle)
+            if entry is None or entry[0] >= key:
+                high = middle
+            else:
+                low = middle + 1
+        entry = line_at(low)
+    return entry[1] if entry is not None and entry[0] == key else []
+
+
+def query_events(log_dir=EVENTS_DIR, order_id=None, username=None):
+    """
+    Возвращает записи журнала по заказу или пользователю.
+    В закрытых сегментах ключ ищется двоичным поиском по .sidx,
+    построчно просматривается только индекс текущего сегмента;
+    читаются только строки журнала, на которые указывает индекс.
+    """
+    key = f"order:{order_id}" if order_id else f"user:{username}"
+    key_json = json.dumps(key, ensure_ascii=False)
+    for log_path in sorted(glob.glob(os.path.join(log_dir, "events-*.jsonl"))):
+        base = log_path[:-6]
+        if os.path.exists(base + ".sidx"):
+            offsets = _search_sorted_index(base + ".sidx", key)
+        elif os.path.exists(base + ".idx"):
+            offsets = []
+            with open(base + ".idx", "r", encoding="utf-8") as f:
+                for line in f:
+                    if key_json in line:
+                        entry_key, offset = json.loads(line)
+                        if entry_key == key:
+                            offsets.append(offset)
+        else:
+            continue
+        if not offsets:
+            continue
+        with open(log_path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                yield json.loads(f.readline())
+
+
+class BufferedLogger:
+    """
+    Логгер с фоновой записью: записи передаются через очередь потоку-писателю,
+    который держит файл открытым и сбрасывает их пачками по размеру или времени.
+    - batch_size: максимальное количество записей в одной пачке
+    - flush_interval: максимальная задержка записи пачки (сек)
+    - echo: выводить ли записи в консоль
+    - events: структурированный журнал EventLog (None - не вести)
+    """
+
+    def __init__(self, path=LOG_FILE, batch_size=100, flush_interval=0.5, echo=True, events_dir=EVENTS_DIR):
+        self.path = path
+        self.events = EventLog(events_dir) if events_dir else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.echo = echo
+        self.queue = queue.Queue()
+        self.file = open(path, "a", encoding="utf-8")
+        self.cached_time = (None, "")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def timestamp(self, ts):
+        """Форматирует время; строка пересчитывается не чаще раза в секунду."""
+        second = int(ts)
+        cached_second, cached = self.cached_time
+        if second != cached_second:
+            cached = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+            self.cached_time = (second, cached)
+        return cached
+
+    def log(self, message, record=None):
+        self.queue.put((message, record))
+
+    def _run(self):
+        running = True
+        while running:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [message for message in batch if message is not None]
+            if batch:
+                self.file.write("\n".join(message for message, _ in batch) + "\n")
+                self.file.flush()
+                if self.events:
+                    self.events.write([record for _, record in batch if record])
+
+    def close(self):
+        """Дописывает все записи из очереди и закрывает файл."""
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+            self.file.close()
+            if self.events:
+                self.events.close()
+
+
+_logger = None
+
+def get_logger():
+    global _logger
+    if _logger is None:
+        _logger = BufferedLogger()
+    return _logger
+
+def configure_logging(path=LOG_FILE, echo=True, batch_size=100, flush_interval=0.5, events_dir=EVENTS_DIR):
+    """Пересоздает логгер с новыми настройками."""
+    global _logger
+    close_logger()
+    _logger = BufferedLogger(path, batch_size, flush_interval, echo, events_dir)
+
+def close_logger():
+    if _logger is not None:
+        _logger.close()
+
+atexit.register(close_logger)
+
+def log_action(action, user=None, details=None, order_id=None, item=None):
+    """
+    Логирует действие в консоль с временной меткой
+    Дополнительно пишет структурированную запись с полями action, user, order_id, item
+    """
+    logger = get_logger()
+    ts = time.time()
+    timestamp = logger.timestamp(ts)
     user_str = f"[{user}]" if user else ""
     details_str = f"- {details}" if details else ""
     log_message = f"[{timestamp}] {user_str} {action} {details_str}"
-    print(log_message)
+    if logger.echo:
+        print(log_message)
     
-    # Опционально: запись в файл
-    with open("logs.txt", "a", encoding="utf-8") as f:
-        f.write(log_message + "\n")
+    # Запись в файл выполняет фоновый поток
+    logger.log(log_message, {
+        "ts": ts,
+        "time": timestamp,
+        "action": action,
+        "user": user,
+        "order_id": order_id,
+        "item": item,
+        "details": details
+    })
 
 def load_json(filepath):
     """
@@ -31,7 +289,192 @@ def load_json(filepath):
         return {}
 
 def save_json(filepath, data):
-    """Сохраняет данные в JSON файл"""
+    """
+    Сохраняет данные в JSON файл
+    Запись атомарная: сначала во временный файл, затем замена оригинала
+    """
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
\ No newline at end of file
+    # Свой временный файл у каждого процесса: записи из разных процессов не смешиваются
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+
+class FileLock:
+    """
+    Рекомендательная блокировка (fcntl.flock) для цикла "прочитать-изменить-записать"
+    над файлом, общим для нескольких процессов. Блокируется отдельный файл path.
+    Повторный вход в том же потоке допускается (учитывается глубина).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.depth = 0
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.depth == 0 and fcntl is not None:
+            if self.fd is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0 and self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        self.lock.release()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class _Inotify:
+    """
+    Наблюдение за каталогами через inotify (Linux, через libc).
+    Чтение событий неблокирующее: без изменений файлов проверка ничего не стоит.
+    """
+
+    # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x8 | 0x80 | 0x100 | 0x200
+    IN_Q_OVERFLOW = 0x4000
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.dirs = {}
+
+    def watch(self, directory):
+        if directory in self.dirs.values():
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+        self.dirs[wd] = directory
+
+    def changes(self):
+        """
+        Возвращает пути файлов, измененных с прошлого вызова.
+        None - очередь событий ядра переполнилась, часть изменений потеряна.
+        """
+        paths = set()
+        overflow = False
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return None if overflow else paths
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, cookie, length = self.EVENT.unpack_from(buffer, offset)
+                offset += self.EVENT.size
+                name = buffer[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    overflow = True
+                elif wd in self.dirs:
+                    paths.add(os.path.join(self.dirs[wd], os.fsdecode(name)))
+
+
+class FileCache:
+    """
+    Кэш JSON файлов, общих для нескольких процессов.
+    Файл перечитывается только если он изменился: сравниваются mtime, размер
+    и inode (save_json заменяет файл целиком, поэтому новый inode - новое поколение).
+    С inotify (use_inotify=True, где доступен) неизмененные файлы не требуют даже stat.
+    Каталог файла ставится под наблюдение до первого stat и чтения, поэтому запись
+    другого процесса сразу после чтения не пропускается; при переполнении очереди
+    событий все файлы проверяются по stat.
+    - entries: {path: (сигнатура, данные)}
+    - generations: число загрузок файла {path: n}
+    """
+
+    def __init__(self, use_inotify=True):
+        self.entries = {}
+        self.generations = {}
+        self.lock = threading.Lock()
+        self.inotify = None
+        if use_inotify:
+            try:
+                self.inotify = _Inotify()
+            except (OSError, AttributeError):
+                self.inotify = None
+        self.changed_paths = set()
+        self.abspaths = {}
+
+    def _abspath(self, path):
+        if path not in self.abspaths:
+            self.abspaths[path] = os.path.abspath(path)
+        return self.abspaths[path]
+
+    def _signature(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _watch(self, path):
+        """Ставит каталог файла под наблюдение inotify (до чтения или записи файла)."""
+        if self.inotify is not None:
+            directory = os.path.dirname(self._abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            with self.lock:
+                self.inotify.watch(directory)
+
+    def _remember(self, path, signature, data):
+        path = self._abspath(path)
+        self.entries[path] = (signature, data)
+        self.generations[path] = self.generations.get(path, 0) + 1
+
+    def changed(self, path):
+        """Проверяет, изменился ли файл после последней загрузки или записи."""
+        path = self._abspath(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return True
+            if self.inotify is not None:
+                changes = self.inotify.changes()
+                # Переполнение: изменения неизвестны - проверяем все файлы по stat
+                self.changed_paths |= set(self.entries) if changes is None else changes
+                if path not in self.changed_paths:
+                    return False
+            if self._signature(path) != entry[0]:
+                return True
+            # Событие от собственной записи или уже перечитанного файла
+            self.changed_paths.discard(path)
+            return False
+
+    def load(self, path):
+        """Возвращает данные файла: из памяти, если файл не изменился."""
+        if not self.changed(path):
+            return self.entries[self._abspath(path)][1]
+        self._watch(path)
+        # Сигнатура снимается до чтения: запись между stat и чтением вызовет лишнее, но не пропущенное перечитывание
+        signature = self._signature(path)
+        data = load_json(path)
+        with self.lock:
+            self._remember(path, signature, data)
+        return data
+
+    def save(self, path, data):
+        """Записывает файл и запоминает его новую сигнатуру (своя запись не вызывает перечитывания)."""
+        self._watch(path)
+        save_json(path, data)
+        with self.lock:
+            self._remember(path, self._signature(path), data)
+
+    def generation(self, path):
+        return self.generations.get(self._abspath(path), 0)